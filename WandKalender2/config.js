@@ -24,7 +24,8 @@ window.WandKalender.config.reloadinterval = 60*60 /*s*/;
 
 var CONFIG_VERSION      = 2.0;  // DO NOT CHANGE
 var WATCHDOG_RUN        = false;
-var WATCHDOG_INTERVAL   = 5000; //[ms] (here, 5 times longer than a heartbeat)
+var WATCHDOG_INTERVAL   = 90000;//[ms] (here, 3 times longer than the keep-alive of the server ([websocket]->keepalive))
 var WEBSOCKET_URL       = "wss://" + location.hostname + ":9000";
+var WEBSOCKET_BINARY    = true; // Use the compact binary encoding if the server supports it ([websocket]->binary)
 var WEBSOCKET_APIKEY    = "a random value"
 
@@ -259,6 +259,8 @@ class MonthCalendar extends Table
     {
         let now = new Date();
         this.ClearTable();
+        this.firstday = new Date(firstDay);
+        this.lastday  = new Date(lastDay);
 
         // Add Headline
         let monthname = firstDay.toLocaleString("default", { month: "long" });
@@ -300,22 +302,101 @@ class MonthCalendar extends Table
 
     UpdateCell(username, isholiday, entry)
     {
-        let start   = new Date(entry.start);
         // HACK: Holiday calendars are no users.
         // So indexOf returns -1.
         // -1 + 1 = 0 | +1 because column 0 is for day and holidays.
         // So Holiday calendar entries get an index of 0
         // because they are not in users. This is just accidentally the right column number.
         let column  = this.users.indexOf(username) + 1;
-        let rowid   = CalcCalendarRowId(start);
-        let row     = this.GetRowById(rowid);
 
+        if(entry.allday === true)
+        {
+            // All-day events are spans from start to end (exclusive).
+            // They get placed into each row of the span that is inside the calendar.
+            let date = this.ParseDate(entry.start);
+            let end  = this.ParseDate(entry.end);
+            if(end <= date) // Invalid span, show it at its start day
+                end = new Date(date.getFullYear(), date.getMonth(), date.getDate() + 1);
+            if(date < this.firstday)
+                date = new Date(this.firstday.getFullYear(), this.firstday.getMonth(), this.firstday.getDate());
+            if(end > this.lastday)
+                end = this.lastday;
+
+            while(date < end)
+            {
+                this.UpdateRow(CalcCalendarRowId(date), column, entry, isholiday);
+                date.setDate(date.getDate() + 1);
+            }
+        }
+        else
+        {
+            let start = new Date(entry.start);
+            this.UpdateRow(CalcCalendarRowId(start), column, entry, isholiday);
+        }
+    }
+
+
+
+    UpdateRow(rowid, column, entry, isholiday)
+    {
+        let row = this.GetRowById(rowid);
         if(typeof row?.UpdateCell === "function")
             row?.UpdateCell(column, entry, isholiday);  // Row may be not available if date is not in range
     }
 
 
 
+    // Parses a "YYYY-MM-DD" date string or a timestamp of 00:00 UTC of a date (binary encoding) as local date
+    ParseDate(value)
+    {
+        if(typeof value === "number")
+        {
+            let utcdate = new Date(value);
+            return new Date(utcdate.getUTCFullYear(), utcdate.getUTCMonth(), utcdate.getUTCDate());
+        }
+        let [year, month, day] = value.split("-").map(Number);
+        return new Date(year, month - 1, day);
+    }
+
+
+
+    // Applies a delta of the server to the cached calendar data and updates the table.
+    // Returns false if the cached data do not have the version the delta is based on.
+    ApplyDelta(delta)
+    {
+        let calendardata = this.cache[delta.name];
+        if(calendardata === undefined || calendardata.version !== delta.base)
+            return false;
+
+        // Added events replace events with the same ID, so applying a delta twice does not duplicate them
+        let removed = new Set(delta.removed.concat(delta.added.map((entry)=>entry.id)));
+        let events  = calendardata.events.filter((entry)=>!removed.has(entry.id));
+        events      = events.concat(delta.added);
+        events.sort((a, b)=>this.StartTime(a) - this.StartTime(b));
+
+        this.Update({
+            name:       delta.name,
+            version:    delta.version,
+            events:     events,
+            isholiday:  delta.isholiday,
+            range:      delta.range,
+            stale:      delta.stale,
+            updated:    delta.updated
+        });
+        return true;
+    }
+
+
+
+    StartTime(entry)
+    {
+        if(entry.allday)
+            return this.ParseDate(entry.start).valueOf();
+        return new Date(entry.start).valueOf();
+    }
+
+
+
     Update(calendardata)
     {
         // Update cache
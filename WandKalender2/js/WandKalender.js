@@ -86,12 +86,24 @@ function onWKServerNotification(fnc, sig, data)
     //window.console?.log("[WKS] Notification");
     //window.console?.log(" >> fnc: "+fnc+"; sig: "+sig);
     //window.console?.log(data);
-    window.WandKalender.webui.Update(data);
+    if(fnc == "WKServer:CalendarUpdate")
+    {
+        window.WandKalender.webui.Update(data);
+    }
+    else if(fnc == "WKServer:CalendarDelta")
+    {
+        // Missed a version? Then get the whole calendar again
+        if(window.WandKalender.webui.ApplyDelta(data) === false)
+            WKServer_Request("GetCalendar", "onCalendarUpdate", {name: data.name});
+    }
+    // "WKServer:KeepAlive" only resets the watchdog
 }
 
 function onWKServerMessage(fnc, sig, args, pass)
 {
     window.console?.log("%c >> fnc: "+fnc+"; sig: "+sig, "color:#7a90c8");
+    if(fnc == "GetCalendar" && args !== null)
+        window.WandKalender.webui.Update(args);
 }
 
 
@@ -44,7 +44,12 @@ function ConnectToWKServer()
         socket.close();
 
     // Create websocket interface
-    socket = new WebSocket(WEBSOCKET_URL);
+    // The server selects the encoding of its packets via the subprotocol
+    let protocols = ["wkserver.json"];
+    if(typeof WEBSOCKET_BINARY !== "undefined" && WEBSOCKET_BINARY === true)
+        protocols.unshift("wkserver.cbor");
+    socket = new WebSocket(WEBSOCKET_URL, protocols);
+    socket.binaryType = "arraybuffer";
     socket.onopen = function()
     {
         if(typeof onWKServerConnectionOpen === "function")
@@ -78,7 +83,11 @@ function ConnectToWKServer()
         // reset WD every time a packet comes
         MDB_ResetWebsocketWatchdog();
 
-        var packet = JSON.parse(e.data);
+        var packet;
+        if(e.data instanceof ArrayBuffer)
+            packet = DecodePacket(e.data);
+        else
+            packet = JSON.parse(e.data);
 
         var fnc  = packet.fncname;
         var sig  = packet.fncsig;
@@ -106,6 +115,191 @@ function DisconnectFromWKServer()
 }
 
 
+///////////////////////////////////////////////////////////////////////////////
+// Binary Encoding ////////////////////////////////////////////////////////////
+
+/**
+ * This function decodes a packet the server sent with binary encoding (subprotocol ``wkserver.cbor``).
+ * The compact calendar data of the packet get expanded,
+ * so that the packet looks like a JSON encoded packet for the rest of the application.
+ * Instead of date and time strings, the events and ranges contain timestamps in milliseconds.
+ * For all-day events, the timestamp addresses 00:00 UTC of the date.
+ *
+ * @param {ArrayBuffer} buffer - The received binary message
+ * @returns {object} The decoded packet
+ */
+function DecodePacket(buffer)
+{
+    let packet = DecodeCBOR(buffer);
+    let fnc    = packet.fncname;
+    if(packet.arguments === null)
+        return packet;
+
+    if(fnc === "WKServer:CalendarUpdate" || fnc === "GetCalendar")
+        packet.arguments = ExpandCalendarData(packet.arguments);
+    else if(fnc === "GetEvents")
+        packet.arguments = packet.arguments.map(ExpandCalendarData);
+    else if(fnc === "WKServer:CalendarDelta")
+        packet.arguments = ExpandCalendarDelta(packet.arguments);
+    return packet;
+}
+
+
+
+function ExpandTimestamp(timestamp)
+{
+    if(timestamp === null)
+        return null;
+    return timestamp * 1000;
+}
+
+function ExpandEvent(compact)
+{
+    return {
+        start:      ExpandTimestamp(compact[0]),
+        end:        ExpandTimestamp(compact[1]),
+        allday:     compact[2],
+        summary:    compact[3],
+        id:         compact[4]
+    };
+}
+
+function ExpandRange(compact)
+{
+    return {start: ExpandTimestamp(compact[0]), end: ExpandTimestamp(compact[1])};
+}
+
+function ExpandCalendarData(compact)
+{
+    return {
+        name:       compact.n,
+        version:    compact.v,
+        events:     compact.ev.map(ExpandEvent),
+        isholiday:  compact.h,
+        range:      ExpandRange(compact.r),
+        stale:      compact.x,
+        updated:    ExpandTimestamp(compact.u)
+    };
+}
+
+function ExpandCalendarDelta(compact)
+{
+    return {
+        name:       compact.n,
+        version:    compact.v,
+        base:       compact.b,
+        added:      compact.ad.map(ExpandEvent),
+        removed:    compact.rm,
+        isholiday:  compact.h,
+        range:      ExpandRange(compact.r),
+        stale:      compact.x,
+        updated:    ExpandTimestamp(compact.u)
+    };
+}
+
+
+
+/**
+ * This function decodes CBOR data (RFC 8949) as created by the server (``wkserver/lib/cbor.py``).
+ * Tags and indefinite length items are not supported.
+ *
+ * @param {ArrayBuffer} buffer - CBOR encoded data
+ * @returns The decoded value
+ */
+function DecodeCBOR(buffer)
+{
+    let view    = new DataView(buffer);
+    let decoder = new TextDecoder("utf-8");
+    let offset  = 0;
+
+    function ReadArgument(additional)
+    {
+        let value;
+        if(additional < 24)
+            return additional;
+        else if(additional === 24)
+        {
+            value = view.getUint8(offset);
+            offset += 1;
+        }
+        else if(additional === 25)
+        {
+            value = view.getUint16(offset);
+            offset += 2;
+        }
+        else if(additional === 26)
+        {
+            value = view.getUint32(offset);
+            offset += 4;
+        }
+        else if(additional === 27)
+        {
+            value = Number(view.getBigUint64(offset));
+            offset += 8;
+        }
+        else
+            throw new Error("Unsupported CBOR argument " + additional);
+        return value;
+    }
+
+    function ReadItem()
+    {
+        let initial    = view.getUint8(offset);
+        let majortype  = initial >> 5;
+        let additional = initial & 0x1F;
+        let value;
+        offset += 1;
+
+        if(majortype === 7) // Simple values and floats
+        {
+            switch(additional)
+            {
+                case 20: return false;
+                case 21: return true;
+                case 22: return null;
+                case 23: return undefined;
+                case 26: value = view.getFloat32(offset); offset += 4; return value;
+                case 27: value = view.getFloat64(offset); offset += 8; return value;
+            }
+            throw new Error("Unsupported CBOR simple value " + additional);
+        }
+
+        let argument = ReadArgument(additional);
+        switch(majortype)
+        {
+            case 0: // Unsigned integer
+                return argument;
+            case 1: // Negative integer
+                return -1 - argument;
+            case 2: // Byte string
+                value = new Uint8Array(buffer, offset, argument);
+                offset += argument;
+                return value;
+            case 3: // Text string
+                value = decoder.decode(new Uint8Array(buffer, offset, argument));
+                offset += argument;
+                return value;
+            case 4: // Array
+                value = new Array(argument);
+                for(let index = 0; index < argument; index++)
+                    value[index] = ReadItem();
+                return value;
+            case 5: // Map
+                value = new Object();
+                for(let index = 0; index < argument; index++)
+                {
+                    let key = ReadItem();
+                    value[key] = ReadItem();
+                }
+                return value;
+        }
+        throw new Error("Unsupported CBOR major type " + majortype);
+    }
+
+    return ReadItem();
+}
+
+
 ///////////////////////////////////////////////////////////////////////////////
 // Websocket Watchdog /////////////////////////////////////////////////////////
 
@@ -50,6 +50,12 @@ setuptools.setup(
             },
         install_requires= [
             "autobahn",
+            "caldav>=0.9",
+            "icalendar>=4.0",
+            "lxml>=4.6",
+            "python-dateutil>=2.8",
+            "requests>=2.25",
+            "urllib3>=1.26",
             ],
         python_requires = ">=3.9",
         keywords        = "", # TODO
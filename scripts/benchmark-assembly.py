@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+#
+# Compares the event assembly of the calendar client with the former approach
+# that sorted the whole event list again after adding the events of each resource.
+#
+# Usage: ./benchmark-assembly.py [-n iterations] [-e events per resource] [sizes ...]
+#
+# Each size is the number of calendar object resources of a synthetic calendar.
+# For each size the time to assemble the calendar's event list gets printed.
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wkserver.lib.event import Event, AssembleEvents, DAY
+
+
+def CreateEventLists(numresources, eventsperresource):
+    random.seed(numresources)
+    begin      = 1640995200     # 2022-01-01
+    eventlists = []
+    for index in range(numresources):
+        events = []
+        for _ in range(eventsperresource):
+            start = begin + random.randrange(0, 56*DAY, 15*60)
+            events.append(Event(start, start + 60*60, False, "Event %i" % index))
+        eventlists.append(events)
+    return eventlists
+
+
+def RepeatedSort(eventlists):
+    events = []
+    for eventlist in eventlists:
+        events.extend(eventlist)
+        events.sort(key=lambda event: event.start)
+    return events
+
+
+def Measure(assembly, eventlists, iterations):
+    begin = time.perf_counter()
+    for _ in range(iterations):
+        assembly(eventlists)
+    return time.perf_counter() - begin
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Benchmark of the event assembly")
+    argparser.add_argument("-n", "--iterations", type=int, default=5, help="number of runs for each size")
+    argparser.add_argument("-e", "--events", type=int, default=1, help="number of events per resource")
+    argparser.add_argument("sizes", nargs="*", type=int, default=[100, 500, 1000, 2000, 5000], help="numbers of resources")
+    args = argparser.parse_args()
+
+    print("\033[1;34m%10s %10s %14s %14s\033[0m" % ("resources", "events", "repeated sort", "assembly"))
+    for size in args.sizes:
+        eventlists = CreateEventLists(size, args.events)
+        if RepeatedSort(eventlists) != AssembleEvents(eventlists):
+            print("\033[1;31mMismatch for %i resources!\033[0m" % (size))
+            return 1
+
+        slowtime = Measure(RepeatedSort,   eventlists, args.iterations) * 1000 / args.iterations
+        fasttime = Measure(AssembleEvents, eventlists, args.iterations) * 1000 / args.iterations
+        print("%10i %10i \033[1;37m%11.3f ms %11.3f ms\033[0m \033[1;32m(%.1fx)\033[0m"
+                % (size, size * args.events, slowtime, fasttime, slowtime / fasttime))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+#
+# Compares the fast iCalendar scanner with the icalendar module based parser.
+#
+# Usage: ./benchmark-parser.py [-n iterations] path [path ...]
+#
+# Each path can be an .ics file or a directory that gets searched for .ics files.
+# For each parser the time to process all files gets printed.
+# Furthermore the results of both parsers are compared.
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wkserver.lib.icalparser import ParseEvents, ScanEvents
+
+
+def FindFiles(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, filenames in os.walk(path):
+                files += [os.path.join(directory, name) for name in filenames if name.lower().endswith(".ics")]
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def Measure(parser, corpus, iterations):
+    begin = time.perf_counter()
+    for _ in range(iterations):
+        for data in corpus:
+            parser(data)
+    return time.perf_counter() - begin
+
+
+def FastParser(data):
+    try:
+        return ScanEvents(data)
+    except ValueError:
+        return ParseEvents(data)
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Benchmark of the iCalendar parsers")
+    argparser.add_argument("-n", "--iterations", type=int, default=10, help="number of runs over the whole corpus")
+    argparser.add_argument("paths", nargs="+", help=".ics files or directories containing .ics files")
+    args = argparser.parse_args()
+    logging.disable(logging.CRITICAL)   # Missing summaries would be reported in each iteration
+
+    files  = FindFiles(args.paths)
+    corpus = []
+    for path in files:
+        with open(path, "r", encoding="utf-8", newline="") as icsfile:
+            corpus.append(icsfile.read())
+    if not corpus:
+        print("\033[1;31mNo .ics files found!\033[0m")
+        return 1
+
+    # Check results
+    numevents = 0
+    fallbacks = 0
+    mismatches= 0
+    for path, data in zip(files, corpus):
+        expected = ParseEvents(data)
+        numevents += len(expected)
+        try:
+            result = ScanEvents(data)
+        except ValueError as e:
+            print("\033[1;33mFallback:\033[0m %s \033[1;30m(%s)\033[0m" % (path, str(e)))
+            fallbacks += 1
+            continue
+        if result != expected:
+            print("\033[1;31mMismatch:\033[0m %s" % (path))
+            mismatches += 1
+
+    print("\033[1;34m%i files, %i events, %i fallbacks, %i mismatches\033[0m" % (len(corpus), numevents, fallbacks, mismatches))
+
+    # Measure
+    slowtime = Measure(ParseEvents, corpus, args.iterations)
+    fasttime = Measure(FastParser,  corpus, args.iterations)
+    print("icalendar: \033[1;37m%8.3f ms\033[0m per corpus" % (slowtime * 1000 / args.iterations))
+    print("fast:      \033[1;37m%8.3f ms\033[0m per corpus \033[1;32m(%.1fx)\033[0m" % (fasttime * 1000 / args.iterations, slowtime / fasttime))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,27 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Unit tests of the self-contained modules of the WKServer.
+
+The tests use the ``unittest`` module and can be run from the root directory of the repository:
+
+    .. code-block:: bash
+
+        python3 -m unittest discover -s tests -t .
+"""
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
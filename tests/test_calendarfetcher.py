@@ -0,0 +1,287 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from datetime import datetime, timedelta
+from wkserver.classes import calendarclient
+from wkserver.classes.calendarclient import CalendarFetcher, CalendarClient, CalendarClientManager
+from wkserver.lib.event import Event, EventIndex
+
+MINUTE = 60
+HOUR   = 60 * MINUTE
+DAY    = 24 * HOUR
+
+
+
+class FakeEventLoop(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+
+def CreateFetcher(minimum=30, maximum=2*HOUR):
+    """
+    Creates a :class:`CalendarFetcher` with one calendar ``"a"`` that is not connected to any server.
+    """
+    fetcher = CalendarFetcher.__new__(CalendarFetcher)
+    fetcher.eventloop = FakeEventLoop()
+    fetcher.client    = CalendarClient.__new__(CalendarClient)   # Only used to build the calendar data
+    fetcher.threshold = 3
+    fetcher.digests   = {}
+    fetcher.schedule  = {"a": {
+            "minimum":  minimum,
+            "maximum":  maximum,
+            "interval": minimum,
+            "failures": 0,
+            "due":      None,
+            "observed": None,
+            "changed":  None,
+            "average":  None}}
+    return fetcher
+
+
+
+class TestReschedule(unittest.TestCase):
+
+    def setUp(self):
+        self.fetcher = CreateFetcher()
+        self.entry   = self.fetcher.schedule["a"]
+
+    def Update(self, delay, success=True, changed=False):
+        self.fetcher.eventloop.now += delay
+        self.fetcher.Reschedule("a", success, changed)
+        return self.entry["interval"]
+
+    def test_QuietCalendarBacksOff(self):
+        # A calendar that never changes after its initial load
+        self.assertEqual(self.Update(0), 30)
+        for _ in range(200):
+            self.Update(self.entry["interval"])
+        self.assertEqual(self.entry["interval"], 2*HOUR)
+        self.assertIsNone(self.entry["average"])
+
+    def test_BackOffFromSingleChange(self):
+        self.Update(0)
+        self.Update(HOUR, changed=True)
+        self.assertIsNone(self.entry["average"])
+        self.assertEqual(self.Update(10*HOUR), HOUR)    # A tenth of the time since the change
+
+    def test_BusyCalendarStaysFresh(self):
+        self.Update(0)
+        for _ in range(50):
+            for _ in range(9):
+                self.Update(self.entry["interval"])
+            self.Update(self.entry["interval"], changed=True)
+            self.assertLess(self.entry["interval"], 2*MINUTE)
+        self.assertEqual(self.entry["interval"], 30)
+
+    def test_Average(self):
+        self.Update(0)
+        self.Update(HOUR, changed=True)
+        self.Update(HOUR, changed=True)
+        self.assertEqual(self.entry["average"], HOUR)
+        self.Update(2*HOUR, changed=True)
+        self.assertAlmostEqual(self.entry["average"], 0.3 * 2*HOUR + 0.7 * HOUR)
+        self.assertAlmostEqual(self.entry["interval"], self.entry["average"] / 10)
+
+    def test_Jitter(self):
+        self.Update(0)
+        self.assertGreaterEqual(self.entry["due"], 30 * 0.9)
+        self.assertLessEqual(self.entry["due"],    30 * 1.1)
+
+    def test_FailuresAndCircuitBreaker(self):
+        self.Update(0)
+        self.assertEqual(self.Update(1, success=False), 60)
+        self.assertEqual(self.Update(1, success=False), 120)
+        with self.assertLogs(level="WARNING"):
+            self.assertEqual(self.Update(1, success=False), 2*HOUR)
+        self.assertEqual(self.entry["failures"], 3)
+        with self.assertLogs(level="INFO"):
+            self.Update(1)
+        self.assertEqual(self.entry["failures"], 0)
+
+
+
+class TestContentChanged(unittest.TestCase):
+
+    def setUp(self):
+        self.fetcher = CreateFetcher()
+        self.monday  = datetime(2022, 3, 7)
+        self.events  = [Event(int((self.monday + timedelta(days=day, hours=10)).timestamp()),
+                              int((self.monday + timedelta(days=day, hours=11)).timestamp()), False, "Termin")
+                        for day in range(21)]
+
+    def Index(self, weeks, events=None):
+        start  = self.monday + timedelta(weeks=weeks)
+        end    = start + timedelta(weeks=2)
+        if events is None:
+            events = self.events
+        events = [event for event in events if start.timestamp() <= event.start < end.timestamp()]
+        return EventIndex(events, start, end)
+
+    def test_InitialLoad(self):
+        self.assertFalse(self.fetcher.ContentChanged(None, self.Index(0)))
+
+    def test_FailedUpdate(self):
+        index = self.Index(0)
+        self.assertFalse(self.fetcher.ContentChanged(index, index))
+
+    def test_SameWindow(self):
+        self.assertFalse(self.fetcher.ContentChanged(self.Index(0), self.Index(0)))
+        changed = list(self.events)
+        changed[3] = Event(changed[3].start, changed[3].end, False, "Verschoben")
+        self.assertTrue(self.fetcher.ContentChanged(self.Index(0), self.Index(0, changed)))
+
+    def test_NewWeek(self):
+        self.assertFalse(self.fetcher.ContentChanged(self.Index(0), self.Index(1)))
+        changed = self.events[:8] + self.events[9:]     # Event removed from the common week
+        self.assertTrue(self.fetcher.ContentChanged(self.Index(0), self.Index(1, changed)))
+
+
+
+
+class PublishTestCase(unittest.TestCase):
+    """
+    Publishes the data of a fake calendar ``"a"`` and records the calls of the callbacks.
+    """
+    def setUp(self):
+        self.fetcher  = CreateFetcher()
+        self.manager  = CalendarClientManager()
+        self.calls    = []
+        self.start    = datetime(2022, 3, 7)
+        self.end      = datetime(2022, 3, 21)
+        self.calendar = {
+                "name":         "a",
+                "calendartype": "Normal",
+                "events":       self.CreateEvents(range(10)),
+                "stale":        False,
+                "updated":      None}
+        calendarclient.LatestData.clear()
+        self.manager.RegisterCallback(self.Callback)
+
+    def tearDown(self):
+        self.manager.RemoveCallback(self.Callback)
+        calendarclient.LatestData.clear()
+
+    def Callback(self, calendardata, delta):
+        self.calls.append((calendardata, delta))
+
+    def CreateEvents(self, numbers):
+        base = int(self.start.timestamp())
+        return [Event(base + number*HOUR, base + number*HOUR + MINUTE, False, "Termin %i" % number) for number in numbers]
+
+    def Publish(self):
+        self.fetcher.Publish(self.calendar, self.start, self.end)
+        return self.manager.GetCalendarData("a")
+
+
+
+
+class TestPublishStale(PublishTestCase):
+
+    def test_StaleStateGetsPublished(self):
+        self.Publish()
+        self.calendar["stale"] = True
+        latest = self.Publish()
+        self.assertEqual(len(self.calls), 2)
+        self.assertTrue(latest["stale"])
+        self.assertEqual(len(latest["events"]), 10)     # Last good events
+
+        calendardata, delta = self.calls[-1]
+        self.assertIs(calendardata, latest)
+        self.assertTrue(delta["stale"])
+        self.assertEqual(delta["added"],   [])
+        self.assertEqual(delta["removed"], [])
+
+
+
+
+class TestPublishUnchanged(PublishTestCase):
+
+    def test_UnchangedDataGetSkipped(self):
+        first = self.Publish()
+        self.calendar["updated"] = 1646647200.0
+        self.calendar["events"]  = self.CreateEvents(range(10))     # New, but equal events
+        latest = self.Publish()
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(latest["version"], first["version"])
+        self.assertIsNotNone(latest["updated"])                     # Latest data are up to date anyway
+
+    def test_ChangedDataGetPublished(self):
+        self.Publish()
+        self.calendar["events"] = self.CreateEvents(range(11))
+        self.Publish()
+        self.assertEqual(len(self.calls), 2)
+
+    def test_Digest(self):
+        calendardata = self.fetcher.client.CalendarData(self.calendar, self.start, self.end)
+        digest       = self.fetcher.Digest(calendardata)
+        calendardata["updated"] = "2022-03-07 10:00:00+01:00"
+        self.assertEqual(self.fetcher.Digest(calendardata), digest)
+        calendardata["isholiday"] = True
+        self.assertNotEqual(self.fetcher.Digest(calendardata), digest)
+
+
+
+
+class TestPublishDelta(PublishTestCase):
+
+    def test_FirstVersion(self):
+        latest = self.Publish()
+        self.assertEqual(latest["version"], 1)
+        self.assertEqual(self.calls, [(latest, None)])
+        self.assertEqual(len(set(event["id"] for event in latest["events"])), 10)
+
+    def test_Delta(self):
+        first = self.Publish()
+        self.calendar["events"] = self.CreateEvents(list(range(1, 10)) + [20])
+        latest = self.Publish()
+        self.assertEqual(latest["version"], 2)
+
+        delta = self.calls[-1][1]
+        self.assertEqual(delta["base"],    1)
+        self.assertEqual(delta["version"], 2)
+        self.assertEqual(delta["removed"], [first["events"][0]["id"]])
+        self.assertEqual(delta["added"],   [latest["events"][-1]])
+
+        # Applying the delta to the previous version results in the current one
+        removed = set(delta["removed"])
+        events  = [event for event in first["events"] if event["id"] not in removed] + delta["added"]
+        self.assertEqual(sorted(event["id"] for event in events), sorted(event["id"] for event in latest["events"]))
+
+    def test_LargeChangeSendsCompleteData(self):
+        self.Publish()
+        self.calendar["events"] = self.CreateEvents(range(5, 15))
+        latest = self.Publish()
+        self.assertEqual(latest["version"], 2)
+        self.assertIsNone(self.calls[-1][1])
+
+    def test_VersionAfterSkippedUpdate(self):
+        self.Publish()
+        self.Publish()
+        self.calendar["events"] = self.CreateEvents(range(11))
+        self.assertEqual(self.Publish()["version"], 2)
+        self.assertEqual(self.calls[-1][1]["base"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,79 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import math
+import unittest
+from wkserver.lib.cbor import EncodeCBOR
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+VALUES = [
+    None, True, False,
+    0, 1, 23, 24, 255, 256, 65535, 65536, 2**32 - 1, 2**32, 2**64 - 1,
+    -1, -24, -25, -256, -257, -2**32, -2**64,
+    0.0, -0.0, 1.5, -1e300, math.inf,
+    "", "a", "Grüße 📅", "x" * 300,
+    b"", b"\x00\xff" * 200,
+    [], [1, [2, [3]]], list(range(30)),
+    {}, {"n": "Familie", "ev": [[1646647200, 1646650800, False, "Termin", "a1b2"]], "x": False},
+]
+
+
+
+class TestEncodeCBOR(unittest.TestCase):
+
+    def test_KnownEncodings(self):
+        # Examples from RFC 8949, Appendix A
+        self.assertEqual(EncodeCBOR(0),            bytes.fromhex("00"))
+        self.assertEqual(EncodeCBOR(24),           bytes.fromhex("1818"))
+        self.assertEqual(EncodeCBOR(1000000),      bytes.fromhex("1a000f4240"))
+        self.assertEqual(EncodeCBOR(-1000),        bytes.fromhex("3903e7"))
+        self.assertEqual(EncodeCBOR(1.1),          bytes.fromhex("fb3ff199999999999a"))
+        self.assertEqual(EncodeCBOR("ü"),          bytes.fromhex("62c3bc"))
+        self.assertEqual(EncodeCBOR([1, [2, 3]]),  bytes.fromhex("8201820203"))
+        self.assertEqual(EncodeCBOR({"a": 1}),     bytes.fromhex("a1616101"))
+        self.assertEqual(EncodeCBOR(None),         bytes.fromhex("f6"))
+
+    def test_TupleIsArray(self):
+        self.assertEqual(EncodeCBOR((1, 2)), EncodeCBOR([1, 2]))
+
+    def test_UnsupportedValues(self):
+        with self.assertRaises(ValueError):
+            EncodeCBOR(2**64)
+        with self.assertRaises(ValueError):
+            EncodeCBOR(-2**64 - 1)
+        with self.assertRaises(TypeError):
+            EncodeCBOR({1, 2})
+
+    @unittest.skipIf(cbor2 is None, "cbor2 not installed")
+    def test_RoundTripWithCBOR2(self):
+        for value in VALUES:
+            with self.subTest(value=value):
+                self.assertEqual(cbor2.loads(EncodeCBOR(value)), value)
+
+    @unittest.skipIf(cbor2 is None, "cbor2 not installed")
+    def test_NaN(self):
+        self.assertTrue(math.isnan(cbor2.loads(EncodeCBOR(math.nan))))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
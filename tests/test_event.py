@@ -0,0 +1,118 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import random
+import unittest
+from datetime import date, datetime, timedelta
+from wkserver.lib.event import Event, AssembleEvents, FilterEvents, EventIndex, DateToTimestamp, TimestampToDate
+
+HOUR = 3600
+DAY  = 24 * HOUR
+
+
+
+def RandomEvents(count, begin, seed):
+    """
+    Returns *count* timed and all-day events starting in the 8 weeks after *begin*, including some long ones.
+    """
+    generator = random.Random(seed)
+    base      = int(begin.timestamp())
+    events    = []
+    for number in range(count):
+        if generator.random() < 0.3:
+            day   = DateToTimestamp(begin.date()) + generator.randrange(56) * DAY
+            days  = generator.choice([1, 1, 1, 2, 14])
+            events.append(Event(day, day + days * DAY, True, "Day %i" % number))
+        else:
+            start    = base + generator.randrange(56 * DAY)
+            duration = generator.choice([0, HOUR, 2 * HOUR, 3 * DAY, 21 * DAY])
+            events.append(Event(start, start + duration, False, "Event %i" % number))
+    return events
+
+
+
+class TestEvent(unittest.TestCase):
+
+    def test_FromValues(self):
+        allday = Event.FromValues(date(2022, 3, 7), date(2022, 3, 8), "Urlaub")
+        self.assertTrue(allday.allday)
+        self.assertEqual(TimestampToDate(allday.start), date(2022, 3, 7))
+        self.assertEqual(allday.ToDict()["end"], "2022-03-08")
+
+        start = datetime(2022, 3, 7, 10).astimezone()
+        timed = Event.FromValues(start, start + timedelta(hours=1), "Termin")
+        self.assertFalse(timed.allday)
+        self.assertEqual(timed.end - timed.start, HOUR)
+
+    def test_PackAndUnpack(self):
+        event = Event(100, 200, False, "Termin")
+        self.assertEqual(Event.Unpack(event.Pack()), event)
+        self.assertEqual(hash(Event.Unpack(event.Pack())), hash(event))
+
+    def test_AssembleEvents(self):
+        first  = [Event(10, 20, False, "a"), Event(30, 40, False, "b")]
+        second = [Event(10, 15, False, "c"), Event(25, 40, False, "d")]
+        events = AssembleEvents([first, second])
+        self.assertEqual([event.summary for event in events], ["a", "c", "d", "b"])
+
+    def test_FilterEvents(self):
+        start  = datetime(2022, 3, 7, 12)
+        end    = datetime(2022, 3, 7, 14)
+        base   = int(start.timestamp())
+        day    = DateToTimestamp(start.date())
+        events = [
+            Event(base - 2*HOUR, base - HOUR,  False, "before"),
+            Event(base - HOUR,   base,         False, "touching"),
+            Event(base,          base,         False, "instant at start"),
+            Event(base + HOUR,   base + HOUR,  False, "instant"),
+            Event(base + 2*HOUR, base + 3*HOUR,False, "after"),
+            Event(day,           day + DAY,    True,  "today"),
+            Event(day - DAY,     day,          True,  "yesterday")]
+        self.assertEqual([event.summary for event in FilterEvents(events, start, end)], ["instant at start", "instant", "today"])
+
+
+
+class TestEventIndex(unittest.TestCase):
+
+    def test_SameResultAsFilterEvents(self):
+        begin  = datetime(2022, 3, 7)
+        end    = begin + timedelta(weeks=8)
+        events = AssembleEvents([RandomEvents(500, begin, seed) for seed in range(3)])
+        index  = EventIndex(events, begin, end)
+
+        generator = random.Random(42)
+        for query in range(200):
+            start = begin + timedelta(minutes=generator.randrange(8 * 7 * 24 * 60))
+            stop  = start + timedelta(minutes=generator.choice([1, 60, 24 * 60, 7 * 24 * 60]))
+            clipped = index.Clip(start, stop)
+            if clipped is None:
+                continue
+            with self.subTest(start=clipped[0], end=clipped[1]):
+                self.assertEqual(index.Overlapping(*clipped), FilterEvents(events, *clipped))
+
+    def test_Clip(self):
+        begin = datetime(2022, 3, 7)
+        end   = datetime(2022, 3, 14)
+        index = EventIndex([], begin, end)
+        self.assertEqual(index.Clip(datetime(2022, 3, 1), datetime(2022, 3, 8)), (begin, datetime(2022, 3, 8)))
+        self.assertIsNone(index.Clip(datetime(2022, 3, 14), datetime(2022, 3, 20)))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,121 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from wkserver.lib.icalparser import ParseEvents, ScanEvents, MISSINGSUMMARY
+
+CALENDAR = "\r\n".join([
+    "BEGIN:VCALENDAR",
+    "VERSION:2.0",
+    "PRODID:-//WandKalender//Tests//DE",
+    "BEGIN:VTIMEZONE",
+    "TZID:Europe/Berlin",
+    "BEGIN:STANDARD",
+    "DTSTART:19701025T030000",
+    "TZOFFSETFROM:+0200",
+    "TZOFFSETTO:+0100",
+    "RRULE:FREQ=YEARLY;BYMONTH=10;BYDAY=-1SU",
+    "END:STANDARD",
+    "BEGIN:DAYLIGHT",
+    "DTSTART:19700329T020000",
+    "TZOFFSETFROM:+0100",
+    "TZOFFSETTO:+0200",
+    "RRULE:FREQ=YEARLY;BYMONTH=3;BYDAY=-1SU",
+    "END:DAYLIGHT",
+    "END:VTIMEZONE",
+    "BEGIN:VEVENT",
+    "UID:allday",
+    "DTSTART;VALUE=DATE:20220307",
+    "DTEND;VALUE=DATE:20220309",
+    "SUMMARY:Urlaub",
+    "END:VEVENT",
+    "BEGIN:VEVENT",
+    "UID:timezone",
+    "DTSTART;TZID=Europe/Berlin:20220327T100000",
+    "DTEND;TZID=Europe/Berlin:20220327T113000",
+    "SUMMARY:Frühstück\\, Kaffee\\; Kuchen",
+    "BEGIN:VALARM",
+    "ACTION:DISPLAY",
+    "SUMMARY:Alarm",
+    "TRIGGER:-PT15M",
+    "END:VALARM",
+    "END:VEVENT",
+    "BEGIN:VEVENT",
+    "UID:utc",
+    "DTSTART:20220310T080000Z",
+    "DTEND:20220310T090000Z",
+    "SUMMARY:A long title that gets folded by the server because it is longe",
+    " r than 75 octets",
+    "END:VEVENT",
+    "BEGIN:VEVENT",
+    "UID:quoted",
+    "DTSTART;X-LABEL=\"a:b\";TZID=Europe/Berlin:20221030T013000",
+    "DTEND;TZID=Europe/Berlin:20221030T040000",
+    "SUMMARY:Zeitumstellung",
+    "END:VEVENT",
+    "BEGIN:VEVENT",
+    "UID:nosummary",
+    "DTSTART:20220311T080000Z",
+    "DTEND:20220311T090000Z",
+    "END:VEVENT",
+    "END:VCALENDAR",
+    ""])
+
+
+
+class TestScanEvents(unittest.TestCase):
+
+    def test_SameResultAsParseEvents(self):
+        with self.assertLogs(level="ERROR"):   # Missing summary
+            parsed  = ParseEvents(CALENDAR)
+        with self.assertLogs(level="ERROR"):
+            scanned = ScanEvents(CALENDAR)
+        self.assertEqual(len(scanned), 5)
+        self.assertEqual(scanned, parsed)
+
+    def test_Values(self):
+        with self.assertLogs(level="ERROR"):
+            events = ScanEvents(CALENDAR)
+        allday, berlin, utc, quoted, nosummary = events
+
+        self.assertTrue(allday.allday)
+        self.assertEqual(allday.end - allday.start, 2 * 24 * 3600)
+        self.assertEqual(berlin.summary, "Frühstück, Kaffee; Kuchen")
+        self.assertEqual(berlin.start,  1648368000)     # 2022-03-27 08:00 UTC (summer time)
+        self.assertEqual(utc.summary,   "A long title that gets folded by the server because it is longer than 75 octets")
+        self.assertEqual(quoted.end - quoted.start, 7 * 1800)   # 2.5 hours plus the hour the clocks got set back
+        self.assertEqual(nosummary.summary, MISSINGSUMMARY)
+
+    def test_UnsupportedData(self):
+        for line in ["DTSTART;VALUE=PERIOD:20220310T080000Z/PT1H",
+                     "DTSTART;TZID=Mars/Olympus_Mons:20220310T080000",
+                     "DTSTART:2022-03-10"]:
+            data = CALENDAR.replace("DTSTART:20220310T080000Z", line)
+            with self.subTest(line=line):
+                with self.assertRaises(ValueError):
+                    ScanEvents(data)
+
+    def test_UnterminatedEvent(self):
+        data = CALENDAR[:CALENDAR.rindex("END:VEVENT")]
+        with self.assertRaises(ValueError):
+            ScanEvents(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
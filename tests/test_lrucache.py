@@ -0,0 +1,94 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from wkserver.lib.lrucache import LRUCache
+
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_GetAndPut(self):
+        cache = LRUCache(100)
+        self.assertIsNone(cache.Get("a"))
+        cache.Put("a", 1, 10)
+        self.assertEqual(cache.Get("a"), 1)
+        self.assertEqual(cache.size,   10)
+        self.assertEqual(cache.hits,   1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_ReplaceEntry(self):
+        cache = LRUCache(100)
+        cache.Put("a", 1, 10)
+        cache.Put("a", 2, 20)
+        self.assertEqual(cache.Get("a"), 2)
+        self.assertEqual(cache.size, 20)
+
+    def test_EvictLeastRecentlyUsed(self):
+        cache = LRUCache(30)
+        cache.Put("a", 1, 10)
+        cache.Put("b", 2, 10)
+        cache.Put("c", 3, 10)
+        cache.Get("a")              # b is the least recently used entry now
+        cache.Put("d", 4, 10)
+        self.assertIsNone(cache.Get("b"))
+        self.assertEqual(cache.Get("a"), 1)
+        self.assertEqual(cache.Get("c"), 3)
+        self.assertEqual(cache.Get("d"), 4)
+        self.assertEqual(cache.size, 30)
+
+    def test_TooLargeValue(self):
+        cache = LRUCache(30)
+        cache.Put("a", 1, 10)
+        cache.Put("b", 2, 31)
+        self.assertIsNone(cache.Get("b"))
+        self.assertEqual(cache.Get("a"), 1)
+
+    def test_Disabled(self):
+        cache = LRUCache(0)
+        cache.Put("a", 1, 1)
+        self.assertIsNone(cache.Get("a"))
+        self.assertEqual(cache.size, 0)
+
+    def test_ResizeEvictsOthers(self):
+        cache = LRUCache(30)
+        cache.Put("a", 1, 10)
+        cache.Put("b", 2, 10)
+        cache.Resize("a", 25)       # a becomes the most recently used entry
+        self.assertIsNone(cache.Get("b"))
+        self.assertEqual(cache.Get("a"), 1)
+        self.assertEqual(cache.size, 25)
+
+    def test_ResizeTooLarge(self):
+        cache = LRUCache(30)
+        cache.Put("a", 1, 10)
+        cache.Put("b", 2, 10)
+        cache.Resize("a", 31)
+        self.assertIsNone(cache.Get("a"))
+        self.assertEqual(cache.Get("b"), 2)
+        self.assertEqual(cache.size, 10)
+
+    def test_ResizeMissingEntry(self):
+        cache = LRUCache(30)
+        cache.Resize("a", 10)
+        self.assertEqual(cache.size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
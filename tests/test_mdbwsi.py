@@ -0,0 +1,143 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import unittest
+from datetime import datetime, timezone
+from wkserver.lib.event import Event, DateToTimestamp
+from wkserver.lib.ws import mdbwsi
+from wkserver.lib.ws.mdbwsi import CompactCalendarData, CompactCalendarDelta, PrepareCalendarUpdate
+
+TIMED  = Event(1646647200, 1646650800, False, "Termin")
+ALLDAY = Event(DateToTimestamp(datetime(2022, 3, 7).date()), DateToTimestamp(datetime(2022, 3, 9).date()), True, "Urlaub")
+
+def EventDict(event, eventid):
+    values = event.ToDict()
+    values["id"] = eventid
+    return values
+
+def Range():
+    calendarrange = {}
+    calendarrange["start"] = str(datetime(2022, 3, 7, tzinfo=timezone.utc))
+    calendarrange["end"]   = str(datetime(2022, 3, 14, tzinfo=timezone.utc))
+    return calendarrange
+
+def CalendarData():
+    calendardata = {}
+    calendardata["name"]      = "Familie"
+    calendardata["version"]   = 3
+    calendardata["events"]    = [EventDict(TIMED, "t1"), EventDict(ALLDAY, "a1")]
+    calendardata["isholiday"] = False
+    calendardata["range"]     = Range()
+    calendardata["stale"]     = False
+    calendardata["updated"]   = str(datetime.fromtimestamp(1646640000).astimezone())
+    return calendardata
+
+def CalendarDelta():
+    delta = {}
+    delta["name"]      = "Familie"
+    delta["version"]   = 4
+    delta["base"]      = 3
+    delta["added"]     = [EventDict(TIMED, "t2")]
+    delta["removed"]   = ["t1"]
+    delta["isholiday"] = False
+    delta["range"]     = Range()
+    delta["stale"]     = True
+    delta["updated"]   = None
+    return delta
+
+
+
+class FakeFactory(object):
+    def __init__(self):
+        self.prepared = []
+
+    def PreparePacket(self, rawdata, binary=False):
+        self.prepared.append(rawdata)
+        return (rawdata, binary)
+
+
+
+class TestCompactCalendarData(unittest.TestCase):
+
+    def test_Data(self):
+        compact = CompactCalendarData(CalendarData())
+        self.assertEqual(compact["n"],  "Familie")
+        self.assertEqual(compact["v"],  3)
+        self.assertEqual(compact["ev"], [
+            [TIMED.start,  TIMED.end,  False, "Termin", "t1"],
+            [ALLDAY.start, ALLDAY.end, True,  "Urlaub", "a1"]])
+        self.assertEqual(compact["h"],  False)
+        self.assertEqual(compact["r"],  [1646611200, 1646611200 + 7 * 24 * 3600])
+        self.assertEqual(compact["x"],  False)
+        self.assertEqual(compact["u"],  1646640000)
+
+    def test_WithoutVersion(self):
+        calendardata = CalendarData()
+        del calendardata["version"]
+        calendardata["updated"] = None
+        compact = CompactCalendarData(calendardata)
+        self.assertIsNone(compact["v"])
+        self.assertIsNone(compact["u"])
+
+    def test_Delta(self):
+        compact = CompactCalendarDelta(CalendarDelta())
+        self.assertEqual(compact["n"],  "Familie")
+        self.assertEqual(compact["v"],  4)
+        self.assertEqual(compact["b"],  3)
+        self.assertEqual(compact["ad"], [[TIMED.start, TIMED.end, False, "Termin", "t2"]])
+        self.assertEqual(compact["rm"], ["t1"])
+        self.assertEqual(compact["r"],  [1646611200, 1646611200 + 7 * 24 * 3600])
+        self.assertEqual(compact["x"],  True)
+        self.assertIsNone(compact["u"])
+
+
+
+class TestPrepareCalendarUpdate(unittest.TestCase):
+
+    def setUp(self):
+        mdbwsi.PreparedUpdates.clear()
+        self.factory = FakeFactory()
+
+    def tearDown(self):
+        mdbwsi.PreparedUpdates.clear()
+
+    def test_JSON(self):
+        calendardata = CalendarData()
+        rawdata, binary = PrepareCalendarUpdate(self.factory, "WKServer:CalendarUpdate", calendardata)
+        packet = json.loads(rawdata)
+        self.assertFalse(binary)
+        self.assertEqual(packet["fncname"],   "WKServer:CalendarUpdate")
+        self.assertEqual(packet["arguments"], calendardata)
+
+    def test_PreparedOnce(self):
+        calendardata = CalendarData()
+        first  = PrepareCalendarUpdate(self.factory, "WKServer:CalendarUpdate", calendardata, True)
+        second = PrepareCalendarUpdate(self.factory, "WKServer:CalendarUpdate", calendardata, True)
+        self.assertIs(first, second)
+        self.assertEqual(len(self.factory.prepared), 1)
+
+        # Each encoding and each new version of the data gets prepared on its own
+        PrepareCalendarUpdate(self.factory, "WKServer:CalendarUpdate", calendardata, False)
+        PrepareCalendarUpdate(self.factory, "WKServer:CalendarUpdate", CalendarData(), True)
+        self.assertEqual(len(self.factory.prepared), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,118 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+from wkserver.lib.recurrence import RecurrenceSet
+from wkserver.lib.event      import TimestampToDate
+
+BERLIN = ZoneInfo("Europe/Berlin")
+
+SERIES = "\r\n".join([
+    "BEGIN:VCALENDAR",
+    "VERSION:2.0",
+    "PRODID:-//WandKalender//Tests//DE",
+    "BEGIN:VEVENT",
+    "UID:brunch",
+    "DTSTART;TZID=Europe/Berlin:20220313T100000",
+    "DTEND;TZID=Europe/Berlin:20220313T120000",
+    "RRULE:FREQ=WEEKLY;UNTIL=20220417T080000Z",
+    "EXDATE;TZID=Europe/Berlin:20220403T100000",
+    "SUMMARY:Brunch",
+    "END:VEVENT",
+    "BEGIN:VEVENT",
+    "UID:brunch",
+    "RECURRENCE-ID;TZID=Europe/Berlin:20220410T100000",
+    "DTSTART;TZID=Europe/Berlin:20220410T150000",
+    "DTEND;TZID=Europe/Berlin:20220410T170000",
+    "SUMMARY:Kaffee",
+    "END:VEVENT",
+    "END:VCALENDAR",
+    ""])
+
+BIRTHDAY = "\r\n".join([
+    "BEGIN:VCALENDAR",
+    "VERSION:2.0",
+    "PRODID:-//WandKalender//Tests//DE",
+    "BEGIN:VEVENT",
+    "UID:birthday",
+    "DTSTART;VALUE=DATE:20200229",
+    "DTEND;VALUE=DATE:20200301",
+    "RRULE:FREQ=YEARLY;BYMONTH=2;BYMONTHDAY=-1",
+    "SUMMARY:Geburtstag",
+    "END:VEVENT",
+    "END:VCALENDAR",
+    ""])
+
+
+
+def InRange(events, start, end):
+    """
+    Returns the events starting in the range as sorted list of (Berlin wall-clock start, summary) tuples.
+    """
+    start = start.timestamp()
+    end   = end.timestamp()
+    times = [(datetime.fromtimestamp(event.start, BERLIN).replace(tzinfo=None), event.summary)
+             for event in events if start <= event.start < end]
+    return sorted(times)
+
+
+
+class TestRecurrenceSet(unittest.TestCase):
+
+    def test_Expand(self):
+        start  = datetime(2022, 3, 1, tzinfo=BERLIN)
+        end    = datetime(2022, 5, 1, tzinfo=BERLIN)
+        series = RecurrenceSet(SERIES)
+        events = series.Expand(datetime(2022, 3, 1), datetime(2022, 5, 1))
+        self.assertEqual(InRange(events, start, end), [
+                (datetime(2022, 3, 13, 10), "Brunch"),
+                (datetime(2022, 3, 20, 10), "Brunch"),
+                (datetime(2022, 3, 27, 10), "Brunch"),      # First day of summer time
+                (datetime(2022, 4, 10, 15), "Kaffee"),      # RECURRENCE-ID, 04-03 is an EXDATE
+                (datetime(2022, 4, 17, 10), "Brunch")])     # UNTIL is inclusive
+
+    def test_DurationAcrossDST(self):
+        series = RecurrenceSet(SERIES)
+        events = series.Expand(datetime(2022, 3, 1), datetime(2022, 5, 1))
+        for event in events:
+            self.assertEqual(event.end - event.start, 2 * 3600)
+
+    def test_ExpandIncrementally(self):
+        series = RecurrenceSet(SERIES)
+        for week in range(8):
+            start  = datetime(2022, 3, 1)  + timedelta(weeks=week)
+            end    = datetime(2022, 3, 15) + timedelta(weeks=week)
+            moving = series.Expand(start, end)
+            fresh  = RecurrenceSet(SERIES).Expand(start, end)
+            start  = start.replace(tzinfo=BERLIN)
+            end    = end.replace(tzinfo=BERLIN)
+            self.assertEqual(InRange(moving, start, end), InRange(fresh, start, end))
+            self.assertGreater(series.Size(), len(SERIES))
+
+    def test_AllDay(self):
+        series = RecurrenceSet(BIRTHDAY)
+        events = series.Expand(datetime(2021, 1, 1), datetime(2025, 1, 1))
+        dates  = sorted(TimestampToDate(event.start) for event in events if event.allday)
+        self.assertEqual(dates, [date(2021, 2, 28), date(2022, 2, 28), date(2023, 2, 28), date(2024, 2, 29)])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
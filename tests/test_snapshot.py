@@ -0,0 +1,84 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import gzip
+import tempfile
+import unittest
+from wkserver.lib.snapshot import WriteSnapshot, ReadSnapshot
+
+STATE = {"calendars": {"Familie": {"ctag": "1", "events": [[1646647200, 1646650800, False, "Termin"]]}}}
+
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def Path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_RoundTrip(self):
+        for name in ["snapshot.json", "snapshot.json.gz"]:
+            with self.subTest(name=name):
+                path = self.Path(name)
+                self.assertTrue(WriteSnapshot(path, STATE))
+                self.assertEqual(ReadSnapshot(path), STATE)
+                self.assertFalse(os.path.exists(path + ".tmp"))
+
+    def test_Compressed(self):
+        path = self.Path("snapshot.json.gz")
+        WriteSnapshot(path, STATE)
+        with open(path, "rb") as snapshotfile:
+            snapshot = json.loads(gzip.decompress(snapshotfile.read()))
+        self.assertEqual(snapshot["state"], STATE)
+
+    def test_FailedWriteKeepsOldSnapshot(self):
+        path = self.Path("snapshot.json")
+        WriteSnapshot(path, STATE)
+        os.mkdir(path + ".tmp")     # The temporary file cannot be created
+        with self.assertLogs(level="WARNING"):
+            self.assertFalse(WriteSnapshot(path, {}))
+        self.assertEqual(ReadSnapshot(path), STATE)
+
+    def test_MissingSnapshot(self):
+        self.assertIsNone(ReadSnapshot(self.Path("missing.json")))
+
+    def test_InvalidSnapshot(self):
+        path = self.Path("snapshot.json.gz")
+        WriteSnapshot(path, STATE)
+        with open(path, "r+b") as snapshotfile:
+            snapshotfile.truncate(10)
+        with self.assertLogs(level="WARNING"):
+            self.assertIsNone(ReadSnapshot(path))
+
+        path = self.Path("snapshot.json")
+        with open(path, "w") as snapshotfile:
+            json.dump({"version": 0, "state": STATE}, snapshotfile)
+        with self.assertLogs(level="WARNING"):
+            self.assertIsNone(ReadSnapshot(path))
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
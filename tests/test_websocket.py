@@ -0,0 +1,93 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import unittest
+from wkserver.lib.ws.websocket import WebSocket, MAXQUEUESIZE
+
+
+
+class RecordingWebSocket(WebSocket):
+    """
+    A connection without transport that records the packets instead of sending them.
+    """
+    def __init__(self):
+        WebSocket.__init__(self)
+        self.peer = "tcp:127.0.0.1:1234"
+        self.sent = []
+
+    def SendPreparedPacket(self, preparedmessage):
+        self.sent.append(preparedmessage)
+        return True
+
+
+
+class TestQueuePreparedPacket(unittest.TestCase):
+
+    def setUp(self):
+        self.client = RecordingWebSocket()
+
+    def test_SendImmediately(self):
+        self.client.QueuePreparedPacket("a", "a1")
+        self.assertEqual(self.client.sent, ["a1"])
+        self.assertFalse(self.client.IsQueued("a"))
+
+    def test_LatestWins(self):
+        self.client.pause_writing()
+        self.client.QueuePreparedPacket("a", "a1")
+        self.client.QueuePreparedPacket("b", "b1")
+        self.client.QueuePreparedPacket("a", "a2")
+        self.assertEqual(self.client.sent, [])
+        self.assertTrue(self.client.IsQueued("a"))
+
+        self.client.resume_writing()
+        self.assertEqual(self.client.sent, ["b1", "a2"])
+        self.assertFalse(self.client.IsQueued("a"))
+
+    def test_DropOldest(self):
+        self.client.pause_writing()
+        with self.assertLogs(level="WARNING"):
+            for number in range(MAXQUEUESIZE + 2):
+                self.client.QueuePreparedPacket(number, number)
+        self.assertEqual(len(self.client.outbox), MAXQUEUESIZE)
+        self.assertFalse(self.client.IsQueued(0))
+        self.assertFalse(self.client.IsQueued(1))
+
+        self.client.resume_writing()
+        self.assertEqual(self.client.sent, list(range(2, MAXQUEUESIZE + 2)))
+
+    def test_PauseWhileFlushing(self):
+        class PausingWebSocket(RecordingWebSocket):
+            def SendPreparedPacket(self, preparedmessage):
+                RecordingWebSocket.SendPreparedPacket(self, preparedmessage)
+                self.pause_writing()    # The write buffer is full after each packet
+                return True
+
+        client = PausingWebSocket()
+        client.pause_writing()
+        client.QueuePreparedPacket("a", "a1")
+        client.QueuePreparedPacket("b", "b1")
+        client.resume_writing()
+        self.assertEqual(client.sent, ["a1"])
+        self.assertTrue(client.IsQueued("b"))
+        client.resume_writing()
+        self.assertEqual(client.sent, ["a1", "b1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -17,91 +17,569 @@
 """
 
 import time
+import json
 import logging
-import threading
-from datetime import date, datetime, timedelta
-from wkserver.lib.cfg.wkserver   import WKServerConfig
+import asyncio
+import random
+import hashlib
+import concurrent.futures
+from urllib.parse import unquote
+from datetime import datetime, timedelta
+from wkserver.lib.lrucache       import LRUCache
+from wkserver.lib.icalparser     import ParseEvents, ScanEvents
+from wkserver.lib.recurrence     import RecurrenceSet
+from wkserver.lib.event          import Event, AssembleEvents, FilterEvents, EventIndex
+from wkserver.lib.snapshot       import ReadSnapshot, WriteSnapshot
+from wkserver.lib.httppool       import PooledHTTPAdapter
 import caldav
-from icalendar import Calendar, Event
+from caldav.lib import error as caldaverror
+from caldav.elements import dav, cdav
+from caldav.elements.base import ValuedBaseElement
+from lxml import etree
 
-Thread          = None
+Fetcher         = None
 Callbacks       = []
-RunThread       = False
+LatestData      = {}    # calendar name -> latest calendar data passed to the callbacks
+JITTER          = 0.1   # Update intervals get randomly varied by ±10%
+CHANGEWEIGHT    = 0.3   # Weight of the latest time between two changes in their moving average
+POLLSPERCHANGE  = 10    # Number of updates that shall happen in the average time between two changes
 
-def StartCalendarClientThread(config):
-    global Thread
-    global RunThread
+def StartCalendarFetcher(config, eventloop):
+    """
+    Creates the :class:`CalendarFetcher` and starts it on the given asyncio event loop.
+    The event loop is the one of the WebSocket server, so that the callbacks get called inside the same thread
+    the WebSocket connections are handled.
+
+    Args:
+        config: The :class:`~wkserver.lib.cfg.wkserver.WKServerConfig` object
+        eventloop: The asyncio event loop the fetcher shall run on
+
+    Returns:
+        ``True`` on success, ``False`` if the fetcher is already running
+    """
+    global Fetcher
     global Callbacks
+    global LatestData
 
-    if Thread != None:
-        logging.warning("Calendar Client Thread already running")
+    if Fetcher != None:
+        logging.warning("Calendar Fetcher already running")
         return False
 
-    Callbacks = []
-    RunThread = True
-    logging.debug("Starting Calendar Client Thread")
-    Thread    = threading.Thread(target=CalendarClientThread, args=[config])
-    Thread.start()
+    Callbacks  = []
+    LatestData = {}
+    logging.debug("Starting Calendar Fetcher")
+    Fetcher   = CalendarFetcher(config, eventloop)
+    Fetcher.Start()
     return True
 
 
-def CalendarClientThread(config):
-    global RunThread
-    global Callbacks
 
-    calendarclient = CalendarClient(config)
-    calendarclient.Connect()
 
-    updaterate = config.data.updaterate
-    interdelay = config.data.interdatadelay
-    pastweeks  = config.data.past
-    futureweeks= config.data.future
+class CalendarFetcher(object):
+    """
+    This class schedules the updates of all calendars on an asyncio event loop.
 
-    while RunThread:
+    The blocking CalDAV requests of the :class:`CalendarClient` get executed by a pool of worker threads.
+    The number of concurrent requests to one host is limited by an ``asyncio.Semaphore`` for each host.
+    As soon as a calendar is updated, its data get passed to all registered callbacks.
+    This happens inside the event loop while other calendars may still be fetched.
 
-        # Wait some time
-        for t in range(updaterate):
-            if not RunThread:
-                return
+    Each calendar has its own update interval between ``updaterate`` and ``maxupdaterate`` seconds.
+    Both can be set for each calendar in its ``[calendar:<name>]`` section.
+    The defaults are the values of the ``[data]`` section.
+
+        * The interval follows the observed change rate of the calendar:
+          It is a tenth (``POLLSPERCHANGE``) of the exponentially weighted moving average of the time between two changes.
+        * As long as the calendar stays quiet for longer than this average,
+          the time since its last change is taken as estimate instead, so quiet calendars back off slowly.
+        * Until a calendar changed at least twice, the time since its last change
+          (or since its first update) is taken as estimate.
+        * The initial load and the assembly for a new week do not count as changes (See :meth:`ContentChanged`).
+        * When the update failed, the interval gets doubled for each failure in a row, up to ``maxupdaterate``.
+
+    So busy calendars keep getting updated often, while a holiday calendar that changes once a year
+    backs off to ``maxupdaterate``.
+
+    After ``[data]->failurethreshold`` failed updates in a row, the circuit breaker of the calendar opens.
+    While it is open, the server gets probed only every ``maxupdaterate`` seconds
+    and the clients get served with the last good data of the calendar, marked as stale.
+    The first successful update closes the breaker and the calendar gets updated at its normal rate again.
+
+    The interval of each update gets randomly varied by ±10% so that the updates of the calendars spread over time.
+    When the week changes, all calendars get updated at the next update.
+
+    The discovery of the calendars on the server (See :meth:`CalendarClient.Connect`) is scheduled independently.
+    It gets repeated every ``[caldav]->rediscover`` seconds to follow changes of the remote calendars.
+    When it fails, it gets retried with exponential backoff starting at ``[data]->updaterate`` seconds.
+    Discoveries and updates never run at the same time.
+
+    Args:
+        config: The :class:`~wkserver.lib.cfg.wkserver.WKServerConfig` object
+        eventloop: The asyncio event loop the fetcher shall run on
+    """
+    def __init__(self, config, eventloop):
+        self.eventloop  = eventloop
+        self.client     = CalendarClient(config)
+        self.pastweeks  = config.data.past
+        self.futureweeks= config.data.future
+        self.executor   = concurrent.futures.ThreadPoolExecutor(
+                max_workers        = config.caldav.workers,
+                thread_name_prefix = "CalDAV")
+        self.hostlimits = {}    # (account name, hostname) -> asyncio.Semaphore
+        self.timer      = None  # Next scheduled update (asyncio.TimerHandle)
+        self.task       = None  # Currently running connect or update task
+        self.snapshot   = config.data.snapshot
+        self.dirty      = False # True when the state changed since the last snapshot
+        self.lock       = asyncio.Lock()    # Prevents discoveries while updating calendars
+        self.scheduling = False # True after the first successful discovery started the update schedule
+        self.rediscover = config.caldav.rediscover
+        self.retryrate  = config.data.updaterate
+        self.threshold  = config.data.failurethreshold
+        self.discoveryfailures = 0
+        self.discoverytimer    = None
+        self.discoverytask     = None
+        self.digests    = {}    # calendar name -> digest of the last data passed to the callbacks
+
+        self.schedule   = {}    # calendar name -> {"minimum", "maximum", "interval", "failures", "due", "observed", "changed", "average"}
+        for name in self.client.calendars:
+            minimum = config.Get(int, "calendar:"+name, "updaterate",    config.data.updaterate)
+            maximum = config.Get(int, "calendar:"+name, "maxupdaterate", config.data.maxupdaterate)
+            if minimum < 1 or maximum < minimum:
+                logging.error("Invalid value for [calendar:%s]->updaterate or [calendar:%s]->maxupdaterate. \033[1;30m(Using [data] values)", name, name)
+                minimum = config.data.updaterate
+                maximum = config.data.maxupdaterate
+            self.schedule[name] = {}
+            self.schedule[name]["minimum"]  = minimum
+            self.schedule[name]["maximum"]  = maximum
+            self.schedule[name]["interval"] = minimum
+            self.schedule[name]["failures"] = 0     # Number of failed updates in a row
+            self.schedule[name]["due"]      = None  # Event loop time of the next update
+            self.schedule[name]["observed"] = None  # Event loop time of the first successful update
+            self.schedule[name]["changed"]  = None  # Event loop time of the last change
+            self.schedule[name]["average"]  = None  # Moving average of the time between two changes
+
+
+
+    def Start(self):
+        """
+        Connects to the CalDAV server and schedules the first update.
+        """
+        self.task = self.eventloop.create_task(self.Connect())
+        return
+
+
+
+    def Stop(self):
+        """
+        Cancels all scheduled and running updates and stops the worker threads.
+        Requests that are already executed by a worker thread get completed.
+        """
+        for handle in (self.timer, self.task, self.discoverytimer, self.discoverytask):
+            if handle:
+                handle.cancel()
+        self.executor.shutdown(wait=True)
+        return
+
+
+
+    async def Connect(self):
+        """
+        Restores the calendars from the snapshot and starts the discovery of the calendars on the CalDAV server.
+        The restored calendars are available immediately.
+        The first update synchronizes them with the server right after the first successful discovery.
+        Like all following discoveries, the first one runs as its own task so that :meth:`Stop` can cancel it.
+        """
+        if self.snapshot:
+            restored = await self.eventloop.run_in_executor(self.executor, self.LoadSnapshot)
+            for name in restored:
+                self.Publish(self.client.calendars[name])
+
+        self.task          = None
+        self.discoverytask = self.eventloop.create_task(self.Discover())
+        return
+
+
+
+    async def Discover(self):
+        """
+        Discovers the calendars on the CalDAV server and schedules the next discovery.
+        After the first discovery that found any calendar, the updates of the calendars get scheduled.
+        """
+        async with self.lock:
+            try:
+                success = await self.eventloop.run_in_executor(self.executor, self.client.Connect)
+            except Exception as e:
+                logging.error("Discovering the calendars on the CalDAV server failed with error %s!", str(e))
+                success = False
+
+        if success:
+            self.discoveryfailures = 0
+            delay = self.rediscover
+        else:
+            self.discoveryfailures += 1
+            delay = min(self.retryrate * 2**self.discoveryfailures, self.rediscover)
+            logging.warning("Next discovery of the calendars in about %i seconds", delay)
+
+        self.discoverytask  = None
+        self.discoverytimer = self.eventloop.call_later(self.Jitter(delay), self.onDiscoveryTimer)
+
+        connected = any(calendar["remotecalendar"] is not None for calendar in self.client.calendars.values())
+        if connected and not self.scheduling:
+            self.scheduling = True
+            now = self.eventloop.time()
+            for entry in self.schedule.values():
+                entry["due"] = now
+            self.Schedule()
+        return
+
+    def onDiscoveryTimer(self):
+        self.discoverytimer = None
+        self.discoverytask  = self.eventloop.create_task(self.Discover())
+        return
+
+
+
+    def LoadSnapshot(self):
+        """
+        Restores the state of the calendars from the snapshot file.
+
+        Returns:
+            A list with the names of the restored calendars
+        """
+        state = ReadSnapshot(self.snapshot)
+        if state is None:
+            return []
+        restored = self.client.RestoreSnapshot(state)
+        logging.info("Restored %i calendars from snapshot %s", len(restored), self.snapshot)
+        return restored
+
+
+
+    def SaveSnapshot(self):
+        """
+        Writes the state of all calendars into the snapshot file.
+        This method must not be called while calendars get updated.
+        """
+        WriteSnapshot(self.snapshot, self.client.GetSnapshot())
+        return
+
+
+
+    def Schedule(self):
+        """
+        Sets the timer to the due time of the calendar that has to be updated next.
+        Calendars without due time get one based on their current interval.
+        """
+        now = self.eventloop.time()
+        for name, entry in self.schedule.items():
+            if entry["due"] is None:
+                entry["due"] = now + self.Jitter(entry["interval"])
+        if not self.schedule:
+            return
+
+        due = min(entry["due"] for entry in self.schedule.values())
+        self.timer = self.eventloop.call_at(due, self.onTimer)
+        return
+
+    def onTimer(self):
+        self.timer = None
+        self.task  = self.eventloop.create_task(self.Update())
+        return
+
+
+
+    def Jitter(self, interval):
+        return interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+
+    def Reschedule(self, name, success, changed):
+        """
+        Adapts the update interval of a calendar to the result of its last update and sets its next due time.
+
+        Args:
+            name (str): Name of the calendar
+            success (bool): ``True`` if the update succeeded
+            changed (bool): ``True`` if the events of the calendar changed
+        """
+        entry = self.schedule[name]
+        now   = self.eventloop.time()
+        if success and entry["observed"] is None:
+            entry["observed"] = now
+        if success and changed:
+            if entry["changed"] is not None:
+                period = now - entry["changed"]
+                if entry["average"] is None:
+                    entry["average"] = period
+                else:
+                    entry["average"] = CHANGEWEIGHT * period + (1 - CHANGEWEIGHT) * entry["average"]
+            entry["changed"] = now
+
+        if not success:
+            entry["failures"] += 1
+            if entry["failures"] == self.threshold:
+                logging.warning("Circuit breaker of %s opened after %i failed updates. \033[1;30m(Serving the last good data, probing every %i seconds)",
+                        name, entry["failures"], entry["maximum"])
+            if entry["failures"] >= self.threshold:
+                entry["interval"]  = entry["maximum"]   # Probe rate while the breaker is open
             else:
-                time.sleep(1)
+                entry["interval"]  = min(entry["minimum"] * 2**entry["failures"], entry["maximum"])
+        else:
+            if entry["failures"] >= self.threshold:
+                logging.info("Circuit breaker of %s closed. \033[1;30m(Updating at normal rate again)", name)
+            entry["failures"]  = 0
+            entry["interval"]  = self.ChangeInterval(entry, now)
+
+        entry["due"] = now + self.Jitter(entry["interval"])
+        logging.debug("Next update of %s in about %i seconds", name, entry["interval"])
+        return
+
 
+
+    def ChangeInterval(self, entry, now):
+        """
+        Returns the update interval of a calendar that matches its observed change rate.
+
+        Args:
+            entry (dict): Schedule entry of the calendar
+            now (float): Current event loop time
+
+        Returns:
+            The interval in seconds, in range of the minimum and maximum interval of the calendar
+        """
+        if entry["changed"] is not None:
+            quiet = now - entry["changed"]
+        elif entry["observed"] is not None:
+            quiet = now - entry["observed"]
+        else:
+            return entry["minimum"]
+
+        if entry["average"] is None:
+            estimate = quiet                            # Less than two changes observed
+        else:
+            estimate = max(entry["average"], quiet)     # Quiet for longer than usual
+        interval = estimate / POLLSPERCHANGE
+        return max(entry["minimum"], min(interval, entry["maximum"]))
+
+
+
+    def HostLimit(self, calendar):
+        """
+        Returns the semaphore that limits the number of concurrent requests of an account to the host of a remote calendar.
+        """
+        account = calendar["account"]
+        key     = (account.name, calendar["remotecalendar"].url.hostname)
+        if key not in self.hostlimits:
+            self.hostlimits[key] = asyncio.Semaphore(account.maxperhost)
+        return self.hostlimits[key]
+
+
+
+    async def Update(self):
+        """
+        Updates all calendars in parallel and schedules the next update.
+        """
         today  = datetime.today()
-        today  = today.replace(hour=0, minute=0, second=0)  # begin of day
-        monday = today - timedelta(days=today.weekday())    # begin of week
-        start  = monday - timedelta(weeks=pastweeks)        # from n weeks in the past
-        end    = monday + timedelta(weeks=(1+futureweeks))  # this week + n next weeks
+        today  = today.replace(hour=0, minute=0, second=0, microsecond=0)   # begin of day
+        monday = today - timedelta(days=today.weekday())                    # begin of week
+        start  = monday - timedelta(weeks=self.pastweeks)                   # from n weeks in the past
+        end    = monday + timedelta(weeks=(1+self.futureweeks))             # this week + n next weeks
 
-        calendarclient.GetEvents(start, end)
+        now   = self.eventloop.time()
+        tasks = []
+        for name, calendar in self.client.calendars.items():
+            # Calendars that got assembled for a different week get updated, too
+            window = calendar["window"]
+            if self.schedule[name]["due"] <= now or (window is not None and window != (start, end)):
+                tasks.append(self.UpdateCalendar(calendar, start, end))
 
-        # for each calendar
-        for name, calendar in calendarclient.calendars.items():
+        logging.debug("Get events of %i calendars from %s to %s", len(tasks), str(start), str(end))
+        async with self.lock:
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logging.error("Updating a calendar failed with error %s!", str(result), exc_info=result)
 
-            # Wait some seconds to reduce load
-            time.sleep(interdelay)
+        # Calendars whose update crashed get a new due time by the Schedule method
+        for entry in self.schedule.values():
+            if entry["due"] <= now:
+                entry["due"] = None
 
-            # Send event of one calendar
-            logging.debug("Update %s", name)
+        if self.snapshot and self.dirty:
+            self.dirty = False
+            try:
+                await self.eventloop.run_in_executor(self.executor, self.SaveSnapshot)
+            except Exception as e:
+                logging.exception("Creating the snapshot failed with error %s!", str(e))
+
+        eventcache = self.client.eventcache
+        logging.debug("Event cache: %i hits, %i misses, %i KiB used",
+                eventcache.hits, eventcache.misses, eventcache.size // 1024)
+        for name, account in self.client.accounts.items():
+            opened, requests = account.httpadapter.Statistics()
+            logging.debug("HTTP connections of account %s: %i requests, %i connections opened, %i reused",
+                    name, requests, opened, max(0, requests - opened))
+
+        self.task = None
+        self.Schedule()
+        return
 
-            if calendar["calendartype"] == "Holiday":
-                isholiday = True
-            else:
-                isholiday = False
 
-            calendardata = {}
-            calendardata["name"]        = name
-            calendardata["events"]      = calendar["events"]
-            calendardata["isholiday"]   = isholiday
-            calendardata["range"]       = {}
-            calendardata["range"]["start"] = str(start)
-            calendardata["range"]["end"]   = str(end)
 
-            for callback in Callbacks:
-                try:
-                    callback(calendardata)
-                except Exception as e:
-                    logging.exception("A Stream Thread event callback function crashed!")
-    return
+    def Digest(self, calendardata):
+        """
+        Returns a digest of the calendar data as they get presented to the clients.
+        The time of the last update is not included, so that the digest only changes when the
+        events, the range or the state of the calendar changed.
+
+        Args:
+            calendardata (dict): Calendar data as returned by :meth:`CalendarClient.CalendarData`
+
+        Returns:
+            The digest as ``bytes``
+        """
+        normalized = [
+                calendardata["events"],
+                calendardata["isholiday"],
+                calendardata["range"],
+                calendardata["stale"]]
+        rawdata = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha1(rawdata.encode("utf-8")).digest()
+
+
+
+    async def UpdateCalendar(self, calendar, start, end):
+        """
+        Updates a single calendar, passes its data to all callbacks and schedules its next update.
+        """
+        remotecalendar = calendar["remotecalendar"]
+        oldevents      = calendar["events"]
+        oldindex       = calendar["index"]
+        oldsyncstate   = (calendar["ctag"], calendar["synctoken"])
+        if remotecalendar is None:
+            logging.warning("Calendar %s not available on the server! \033[0m(Last good data will be used)", calendar["name"])
+            if calendar["events"] is None:
+                calendar["events"] = []
+            calendar["stale"] = True
+            success = False
+        else:
+            async with self.HostLimit(calendar):
+                success = await self.eventloop.run_in_executor(self.executor, self.client.UpdateCalendar, calendar, start, end)
+
+        newevents = calendar["events"]
+        changed   = self.ContentChanged(oldindex, calendar["index"])
+        self.Reschedule(calendar["name"], success, changed)
+        if success and (newevents is not oldevents or oldsyncstate != (calendar["ctag"], calendar["synctoken"])):
+            self.dirty = True
+
+        logging.debug("Update %s", calendar["name"])
+        self.Publish(calendar, start, end)
+        return
+
+
+
+    def ContentChanged(self, oldindex, newindex):
+        """
+        Checks if the events of a calendar changed on the server.
+        Only the range covered by both indices gets compared,
+        so a calendar that just got assembled for a new week does not count as changed.
+        The initial load of a calendar does not count as change either.
+
+        Args:
+            oldindex: :class:`~wkserver.lib.event.EventIndex` of the events before the update, or ``None``
+            newindex: :class:`~wkserver.lib.event.EventIndex` of the events after the update, or ``None``
+
+        Returns:
+            ``True`` if the events inside the common range differ
+        """
+        if oldindex is None or newindex is None or newindex is oldindex:
+            return False
+        common = oldindex.Clip(newindex.start, newindex.end)
+        if common is None:
+            return False
+        return oldindex.Overlapping(*common) != newindex.Overlapping(*common)
+
+
+
+    def Publish(self, calendar, start=None, end=None):
+        """
+        Passes the data of a calendar to all callbacks.
+        If *start* and *end* are not given, the range of the calendar's index is used.
+        The data also get stored as latest data of the calendar (See :meth:`CalendarClientManager.GetLatestData`).
+        The calendar data object must not be modified, so that it can be shared between all connections.
+
+        Each event of the calendar data has an ``id`` (See :meth:`CalendarClient.AssignEventIDs`)
+        and the calendar data get a ``version`` that gets incremented each time the data change.
+        When the data did not change since they were passed to the callbacks the last time,
+        the callbacks do not get called (See :meth:`Digest`).
+
+        The callbacks get called with the calendar data and the delta to the previous version (See :meth:`Delta`).
+        The delta is ``None`` when the complete calendar data shall be sent.
+        """
+        if start is None or end is None:
+            start = calendar["index"].start
+            end   = calendar["index"].end
+
+        name         = calendar["name"]
+        calendardata = self.client.CalendarData(calendar, start, end)
+        previous     = LatestData.get(name)
+
+        digest = self.Digest(calendardata)
+        if previous is not None and self.digests.get(name) == digest:
+            calendardata["version"] = previous["version"]
+            LatestData[name] = calendardata
+            logging.debug("Data of %s did not change \033[1;30m(No update will be sent)", name)
+            return
+        self.digests[name] = digest
+
+        if previous is not None:
+            calendardata["version"] = previous["version"] + 1
+        else:
+            calendardata["version"] = 1
+        delta = self.Delta(previous, calendardata)
+        LatestData[name] = calendardata
+
+        for callback in Callbacks:
+            try:
+                callback(calendardata, delta)
+            except Exception:
+                logging.exception("A Calendar Fetcher callback function crashed!")
+        return
+
+
+
+    def Delta(self, previous, current):
+        """
+        Compares two versions of a calendar's data.
+
+        Args:
+            previous (dict): Calendar data of the previous version, or ``None``
+            current (dict): Calendar data of the current version
+
+        Returns:
+            The delta as dictionary or ``None`` when sending the complete calendar data is not more expensive
+        """
+        if previous is None:
+            return None
+
+        previousids = set(event["id"] for event in previous["events"])
+        currentids  = set(event["id"] for event in current["events"])
+        added       = [event for event in current["events"] if event["id"] not in previousids]
+        removed     = [event["id"] for event in previous["events"] if event["id"] not in currentids]
+        if len(added) + len(removed) >= len(current["events"]):
+            return None
+
+        delta = {}
+        delta["name"]       = current["name"]
+        delta["version"]    = current["version"]
+        delta["base"]       = previous["version"]
+        delta["added"]      = added
+        delta["removed"]    = removed
+        delta["isholiday"]  = current["isholiday"]
+        delta["range"]      = current["range"]
+        delta["stale"]      = current["stale"]
+        delta["updated"]    = current["updated"]
+        return delta
 
 
 
@@ -110,140 +588,919 @@ class CalendarClientManager(object):
     def __init__(self):
         pass
 
-    def StopThread(self):
-        global RunThread
-        global Thread
+    def Stop(self):
+        global Fetcher
         logging.debug("Stopping Calendar Manager…")
-        RunThread = False
-        Thread.join()
+        if Fetcher:
+            Fetcher.Stop()
+            Fetcher = None
+
+    def GetEvents(self, start, end, names=None):
+        """
+        Returns the events of the calendars for the range from *start* to *end*.
+        The events are taken from the cache of the calendar fetcher (See :meth:`CalendarClient.QueryEvents`).
+
+        Args:
+            start (datetime): Begin of the range (naive, local time)
+            end (datetime): End of the range (naive, local time)
+            names (list): Names of the calendars. ``None`` for all calendars.
+
+        Returns:
+            A list of calendar data as sent with each calendar update. Calendars without data are skipped.
+            The events have the same ``id`` as in the calendar updates
+            and the ``version`` is the one of the latest update sent to the clients (``None`` if none got sent yet).
+        """
+        if Fetcher == None:
+            return []
+
+        client = Fetcher.client
+        if names is None:
+            names = list(client.calendars.keys())
+
+        calendars = []
+        for name in names:
+            calendardata = client.QueryEvents(name, start, end)
+            if calendardata is None:
+                continue
+            latestdata = LatestData.get(name)
+            if latestdata is not None:
+                calendardata["version"] = latestdata["version"]
+            else:
+                calendardata["version"] = None
+            calendars.append(calendardata)
+        return calendars
+
+    def GetCalendarData(self, name):
+        """
+        Returns the calendar data of a single calendar that were passed to the callbacks with its last update.
+        Clients use this to get back in sync when they missed a version of a calendar.
+
+        Returns:
+            The calendar data or ``None`` if there are no data for that calendar. The data must not be modified.
+        """
+        return LatestData.get(name)
+
+    def GetLatestData(self):
+        """
+        Returns the calendar data that were passed to the callbacks with the last update of each calendar.
+        This allows providing new connections with data without waiting for the next update.
+
+        Returns:
+            A list of calendar data. The data must not be modified.
+        """
+        return list(LatestData.values())
 
     def RegisterCallback(self, function):
-        global Callbacks
         Callbacks.append(function)
 
     def RemoveCallback(self, function):
-        global Callbacks
-
         # Not registered? Then do nothing.
         if not function in Callbacks:
-            logging.warning("A Thread callback function should be removed, but did not exist in the list of callback functions!")
+            logging.warning("A Calendar Fetcher callback function should be removed, but did not exist in the list of callback functions!")
             return
         Callbacks.remove(function)
 
 
 
-class CalendarClient(object):
-    def __init__(self, config):
-        #self.shutdown    = False
-        self.config     = config
-        self.username   = self.config.caldav.username
-        self.password   = self.config.caldav.password
-        self.url        = self.config.caldav.url
+class GetCTag(ValuedBaseElement):
+    """
+    The ``getctag`` property of a calendar collection (calendarserver.org extension).
+    The server changes its value whenever a resource inside the collection changes.
+    """
+    tag = "{http://calendarserver.org/ns/}getctag"
+
+
+
+class CalDAVAccount(object):
+    """
+    This class represents one account on a CalDAV server with its own HTTP session and connection pool.
+
+    The account ``default`` is configured in the ``[caldav]`` section.
+    Further accounts get listed in ``[caldav]->accounts``.
+    Each of them is configured in a ``[caldav:<name>]`` section with the options
+    ``url``, ``username``, ``password``, ``poolsize``, ``keepalive`` and ``maxperhost``.
+    Options that are not set default to the values of the ``[caldav]`` section.
+
+    Args:
+        config: The :class:`~wkserver.lib.cfg.wkserver.WKServerConfig` object
+        name (str): Name of the account
+    """
+    def __init__(self, config, name):
+        if name == "default":
+            section = "caldav"
+        else:
+            section = "caldav:" + name
+
+        self.name       = name
+        self.url        = config.Get(str,  section, "url",        config.caldav.url)
+        self.username   = config.Get(str,  section, "username",   config.caldav.username)
+        self.password   = config.Get(str,  section, "password",   config.caldav.password)
+        self.poolsize   = config.Get(int,  section, "poolsize",   config.caldav.poolsize)
+        self.keepalive  = config.Get(bool, section, "keepalive",  config.caldav.keepalive)
+        self.maxperhost = config.Get(int,  section, "maxperhost", config.caldav.maxperhost)
+        if self.poolsize < 1 or self.maxperhost < 1:
+            logging.error("Invalid value for [%s]->poolsize or [%s]->maxperhost. Both must be at least 1. \033[1;30m(Using 1 instead)", section, section)
+            self.poolsize   = max(1, self.poolsize)
+            self.maxperhost = max(1, self.maxperhost)
+
+        self.principal  = None  # Gets discovered by CalendarClient.Connect
         # Initialize client - does not try to connect
         self.davclient  = caldav.DAVClient(
                 url             = self.url,
                 username        = self.username,
                 password        = self.password,
                 ssl_verify_cert = False)
+        # Keep the connections to the server open between the requests
+        self.httpadapter = PooledHTTPAdapter(self.poolsize, self.keepalive)
+        self.davclient.session.mount("https://", self.httpadapter)
+        self.davclient.session.mount("http://",  self.httpadapter)
+
+
+
+    def Discover(self):
+        """
+        Returns the calendars of the account's principal.
+        The principal gets discovered only once and is reused for later discoveries.
+
+        Returns:
+            A list of remote calendars
+
+        Raises:
+            Exceptions of the *caldav* module when accessing the server fails
+        """
+        if self.principal is None:
+            self.principal = self.davclient.principal()
+        try:
+            return self.principal.calendars()
+        except Exception as e:
+            self.principal = None   # Discover the principal again next time
+            raise e
+
+
+
+class CalendarClient(object):
+    def __init__(self, config):
+        #self.shutdown    = False
+        self.config     = config
+        self.incremental= self.config.data.incremental
+        self.eventcache = LRUCache(self.config.data.cachesize * 1024)   # (href, etag) or hash -> events
+        self.fastparser = self.config.data.parser == "fast"
+        self.localexpansion = self.config.data.expansion == "local"
+
+        self.accounts  = {} # name -> CalDAVAccount
+        for accountname in ["default"] + self.config.caldav.accounts:
+            self.accounts[accountname] = CalDAVAccount(self.config, accountname)
 
         self.calendars = {} # Internal calendar representation
         calendarnames  = self.config.Get(str, "calendars", "calendars", [], islist=True)
         for calendarname in calendarnames:
             calendartype = self.config.Get(str, "calendar:"+calendarname, "type",       "User")
             remotename   = self.config.Get(str, "calendar:"+calendarname, "remotename", "")
-            self.AddCalendarEntry(calendartype, calendarname, remotename)
+            accountname  = self.config.Get(str, "calendar:"+calendarname, "account",    "default")
+            if accountname not in self.accounts:
+                logging.error("Invalid value for [calendar:%s]->account. Account %s does not exist. \033[1;30m(Calendar will be ignored)", calendarname, accountname)
+                continue
+            self.AddCalendarEntry(calendartype, calendarname, remotename, self.accounts[accountname])
+
+        # Accounts without calendars do not need to be discovered
+        usedaccounts  = [calendar["account"] for calendar in self.calendars.values()]
+        self.accounts = {name: account for name, account in self.accounts.items() if account in usedaccounts}
         return
 
 
 
-    def AddCalendarEntry(self, calendartype, name, remotename):
+    def AddCalendarEntry(self, calendartype, name, remotename, account):
         """
         CalendarType: "User", "Holiday"
         """
-        logging.debug("New Calendar: name=%s, type=%s, remotename=%s", name, calendartype, remotename)
+        logging.debug("New Calendar: name=%s, type=%s, remotename=%s, account=%s", name, calendartype, remotename, account.name)
         self.calendars[name] = {}
         self.calendars[name]["name"]         = name
         self.calendars[name]["calendartype"] = calendartype
         self.calendars[name]["remotename"]   = remotename
+        self.calendars[name]["account"]      = account
         self.calendars[name]["remotecalendar"] = None  # Gets updated inside the Connect method
-        self.calendars[name]["events"]         = None  # Gets updated inside the GetEvents method
+        self.calendars[name]["remoteurl"]      = None  # URL of the remote calendar, to detect renamed and replaced calendars
+        self.calendars[name]["events"]         = None  # Gets updated inside the UpdateCalendar method
+        self.calendars[name]["index"]          = None  # EventIndex of the events, for queries of clients
+        self.calendars[name]["updated"]        = None  # Time of the last successful update (time.time())
+        self.calendars[name]["stale"]          = False # True when the last update failed and the events are the last good ones
+        # State for incremental synchronization (See SyncCalendar method)
+        self.calendars[name]["ctag"]           = None  # CTag of the last successful sync
+        self.calendars[name]["synctoken"]      = None  # RFC 6578 sync-token of the last successful sync
+        self.calendars[name]["resources"]      = {}    # href -> {"etag", "events", "recurring", "series"}
+        self.calendars[name]["window"]         = None  # (start, end) the events got assembled for
+        self.calendars[name]["syncable"]       = self.incremental
+        self.calendars[name]["queryable"]      = self.incremental
         return
 
 
 
     def Connect(self):
-        logging.debug("Connecting to caldav server");
+        """
+        Discovers the calendars of the principals of all accounts on the CalDAV servers
+        and maps them to the configured calendars by their ``remotename``.
+
+        If a remote calendar cannot be found by its name, but a calendar with the URL of the previously mapped one exists,
+        the calendar was renamed on the server and gets remapped by its URL.
+        If the URL of a calendar changed, its synchronization state gets reset.
+        When the discovery of an account fails, the mapping of its calendars stays as it is.
+
+        This method blocks until all requests to the servers are done.
+
+        Returns:
+            ``True`` if the discovery succeeded for all accounts, otherwise ``False``
+        """
+        success = True
+        for accountname, account in self.accounts.items():
+            logging.debug("Discovering calendars of account %s on %s", accountname, account.url);
+            try:
+                remotecalendars = account.Discover()
+            except Exception as e:
+                logging.error("Discovering the calendars of account %s failed with error %s!", accountname, str(e))
+                success = False
+                continue
+
+            if not remotecalendars:
+                logging.error("No calendars found for account %s!", accountname)
+                success = False
+                continue
+
+            for name, calendar in self.calendars.items():
+                if calendar["account"] is account:
+                    self.MapRemoteCalendar(calendar, self.FindRemoteCalendar(calendar, remotecalendars))
+        return success
+
+
+
+    def FindRemoteCalendar(self, calendar, remotecalendars):
+        """
+        Returns the remote calendar of a calendar by its ``remotename``, or by its URL if it got renamed.
 
-        principal       = self.davclient.principal()
-        remotecalendars = principal.calendars()
+        Returns:
+            The remote calendar or ``None`` if it does not exist
+        """
+        for candidate in remotecalendars:
+            if calendar["remotename"] == candidate.name:
+                return candidate
+
+        for candidate in remotecalendars:
+            if calendar["remoteurl"] is not None and str(candidate.url) == calendar["remoteurl"]:
+                logging.warning("Calendar %s got renamed to %s on the server. \033[1;30m(Update [calendar:%s]->remotename)",
+                        calendar["remotename"], candidate.name, calendar["name"])
+                return candidate
+
+        logging.warning("Calendar %s not found on the server!", calendar["remotename"])
+        return None
+
+
+
+    def MapRemoteCalendar(self, calendar, remotecalendar):
+        """
+        Sets the remote calendar of a calendar.
+        If the URL of the remote calendar differs from the previous one, the synchronization state gets reset.
+        """
+        if remotecalendar is None:
+            calendar["remotecalendar"] = None
+            return
+
+        url = str(remotecalendar.url)
+        if calendar["remoteurl"] is not None and calendar["remoteurl"] != url:
+            logging.info("URL of calendar %s changed. \033[1;30m(Synchronizing from scratch)", calendar["name"])
+            calendar["ctag"]      = None
+            calendar["synctoken"] = None
+            calendar["resources"] = {}
+            calendar["window"]    = None
+            calendar["syncable"]  = self.incremental
+            calendar["queryable"] = self.incremental
+
+        calendar["remotecalendar"] = remotecalendar
+        calendar["remoteurl"]      = url
+        return
+
+
+
+    def CalendarData(self, calendar, start, end, events=None):
+        """
+        Returns the data of a calendar as it gets sent to the clients.
+        If *events* is ``None``, all events of the calendar are used.
+        """
+        if calendar["calendartype"] == "Holiday":
+            isholiday = True
+        else:
+            isholiday = False
+
+        if events is None:
+            events = calendar["events"]
+
+        calendardata = {}
+        calendardata["name"]        = calendar["name"]
+        calendardata["events"]      = [event.ToDict() for event in events]
+        self.AssignEventIDs(calendardata["events"])
+        calendardata["isholiday"]   = isholiday
+        calendardata["range"]       = {}
+        calendardata["range"]["start"] = str(start)
+        calendardata["range"]["end"]   = str(end)
+        calendardata["stale"]       = calendar["stale"]
+        if calendar["updated"] is not None:
+            calendardata["updated"] = str(datetime.fromtimestamp(calendar["updated"]).astimezone())
+        else:
+            calendardata["updated"] = None
+        return calendardata
+
+
+
+    def AssignEventIDs(self, events):
+        """
+        Adds an ``id`` to each event dictionary of the list.
+        The ID is derived from the content of the event, so the same event gets the same ID in each version of a calendar.
+        Identical events get a counter appended to their ID.
+        A changed event therefore gets a new ID.
+        """
+        counts = {}
+        for event in events:
+            key     = "%s|%s|%s|%s" % (event["start"], event["end"], event["allday"], event["summary"])
+            eventid = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+            count   = counts.get(eventid, 0)
+            counts[eventid] = count + 1
+            if count > 0:
+                eventid += ".%i" % (count)
+            event["id"] = eventid
+        return
+
+
+
+    def QueryEvents(self, name, start, end):
+        """
+        Returns the data of a calendar for an arbitrary range, as it gets sent to the clients.
+        The events are taken from the calendar's :class:`~wkserver.lib.event.EventIndex`, so no request to the CalDAV server is made.
+        Only the part of the range that is covered by the last update is available.
+        The ``range`` entry of the returned data is this clipped range.
+
+        Args:
+            name (str): Name of the calendar
+            start (datetime): Begin of the range (naive, local time)
+            end (datetime): End of the range (naive, local time)
+
+        Returns:
+            The calendar data or ``None`` if the calendar does not exist or if no events are available for the range
+        """
+        calendar = self.calendars.get(name)
+        if calendar is None:
+            return None
+
+        index = calendar["index"]   # The index may get replaced by a worker thread at any time
+        if index is None:
+            return None
+        window = index.Clip(start, end)
+        if window is None:
+            return None
+        return self.CalendarData(calendar, window[0], window[1], index.Overlapping(*window))
+
+
+
+    def ProcessRemoteEvent(self, remoteevent, etag=None):
+        """
+        Returns the list of events of a remote calendar object.
+
+        Parsing the iCalendar data is expensive, so the results are cached (See :meth:`CacheKey`).
+        The size of the raw data is used as estimation of the size of a cache entry.
+
+        Args:
+            remoteevent: The remote calendar object
+            etag (str): Optional ETag of the object
+
+        Returns:
+            A list of :class:`~wkserver.lib.event.Event` objects. The list and its events must not be modified.
+        """
+        data   = remoteevent.data
+        key    = self.CacheKey(self.ResourceHref(remoteevent), remoteevent.data, etag)
+        events = self.eventcache.Get(key)
+        if events is None:
+            events = self.ParseEvents(data)
+            self.eventcache.Put(key, events, len(data))
+        return events
+
+
+
+    def ProcessRecurringEvent(self, remoteevent, etag=None):
+        """
+        Returns the :class:`~wkserver.lib.recurrence.RecurrenceSet` of a remote calendar object with recurring events.
+        The recurrence sets are cached like the events in :meth:`ProcessRemoteEvent`.
+        So the expansions cached inside the set survive as long as the object does not change.
+        The size of a cache entry includes the expanded occurrences (See :meth:`ExpandRecurringEvent`).
+
+        Returns:
+            A :class:`~wkserver.lib.recurrence.RecurrenceSet` or ``None`` if it cannot be created
+        """
+        return self.RecurringSeries(self.ResourceHref(remoteevent), remoteevent.data, etag)
+
+
+
+    def RecurringSeries(self, href, data, etag=None):
+        """
+        Returns the cached :class:`~wkserver.lib.recurrence.RecurrenceSet` of a calendar object,
+        or creates it and puts it into the event cache.
+        This is also used to recreate the sets from a snapshot, so that they count against the cache limit, too.
+
+        Args:
+            href (str): Path of the calendar object (See :meth:`ResourceHref`)
+            data (str): iCalendar data of the calendar object
+            etag (str): ETag of the calendar object, if known
+
+        Returns:
+            A :class:`~wkserver.lib.recurrence.RecurrenceSet` or ``None`` if it cannot be created
+        """
+        key    = ("RecurrenceSet", self.CacheKey(href, data, etag))
+        series = self.eventcache.Get(key)
+        if series is None:
+            try:
+                series = RecurrenceSet(data)
+            except Exception as e:
+                logging.warning("Expanding the recurring event %s failed with error %s! \033[1;30m(Only the first occurrence will be shown)",
+                        href, str(e))
+                return None
+            series.cachekey = key
+            self.eventcache.Put(key, series, series.Size())
+        return series
+
+
+
+    def ExpandRecurringEvent(self, series, start, end):
+        """
+        Returns the occurrences of a recurring event that may overlap the range from *start* to *end* (See :meth:`~wkserver.lib.recurrence.RecurrenceSet.Expand`).
+        The expanded occurrences stay inside the set, so its size in the event cache gets updated afterwards.
+        This keeps the cache limit meaningful even for rules with an unlimited number of occurrences.
+        """
+        events = series.Expand(start, end)
+        self.eventcache.Resize(series.cachekey, series.Size())
+        return events
+
+
+
+    def CacheKey(self, href, data, etag):
+        """
+        Returns the key for the event cache.
+        If the ETag of the object is known, the href and ETag identify the object.
+        Otherwise a hash of the iCalendar data is used.
+        """
+        if etag:
+            return (href, etag)
+        return hashlib.sha1(data.encode("utf-8")).digest()
+
+
+
+    def ParseEvents(self, data):
+        """
+        Extracts the events from iCalendar data using the parser selected by ``[data]->parser``.
+        The fast scanner falls back to the *icalendar* module if it cannot handle the data.
+        """
+        if self.fastparser:
+            try:
+                return ScanEvents(data)
+            except ValueError as e:
+                logging.debug("Fast iCalendar scanner failed with error %s. \033[1;30m(Falling back to the icalendar module)", str(e))
+        return ParseEvents(data)
+
+
+
+    def ResourceHref(self, remoteobject):
+        """
+        Returns the unquoted path of a remote calendar object.
+        This path is used as key to identify a resource between two synchronizations.
+        """
+        return unquote(str(remoteobject.url.path))
+
+
+
+    def IsRecurring(self, remoteevent):
+        """
+        Checks if the raw iCalendar data of a remote event contains recurrence information.
+        """
+        data = remoteevent.data
+        for key in ("\nRRULE", "\nRDATE", "\nRECURRENCE-ID"):
+            if key in data:
+                return True
+        return False
+
+
+
+    def AssembleEvents(self, calendar, eventlists, start, end):
+        """
+        This method builds the ``events`` list and the ``index`` of a calendar.
+        All-day events spanning multiple days are kept as one event.
+        The clients place them into each day from ``start`` to ``end`` (exclusive).
+
+        Args:
+            calendar (dict): Internal calendar representation
+            eventlists (list): A list of event lists as returned by :meth:`ProcessRemoteEvent`
+            start (datetime): Begin of the range the events got requested for
+            end (datetime): End of the range the events got requested for
+
+        Returns:
+            *Nothing*
+        """
+        events = AssembleEvents(eventlists)
+        calendar["events"] = events
+        calendar["index"]  = EventIndex(events, start, end)
+        return
+
+
+
+    def SearchEvents(self, calendar, start, end):
+        """
+        Full update of a calendar.
+        All events between *start* and *end* get requested from the server.
+        Recurring events get expanded by the server or locally, depending on the ``[data]->expansion`` setting.
+        """
+        remoteevents = calendar["remotecalendar"].date_search(start=start, end=end, expand=not self.localexpansion)
+        #remoteevents = calendar["remotecalendar"].search(start=start, end=end, expand=True)
+        eventlists   = []
+        for remoteevent in remoteevents:
+            series = None
+            if self.localexpansion and self.IsRecurring(remoteevent):
+                series = self.ProcessRecurringEvent(remoteevent)
+
+            if series is not None:
+                eventlists.append(FilterEvents(self.ExpandRecurringEvent(series, start, end), start, end))
+            else:
+                eventlists.append(self.ProcessRemoteEvent(remoteevent))
+
+        self.AssembleEvents(calendar, eventlists, start, end)
+        calendar["window"] = (start, end)
+        return
 
-        if not remotecalendars:
+
+
+    def SyncCalendar(self, calendar, start, end):
+        """
+        Incremental update of a calendar.
+
+        First the CTag of the calendar gets compared to the one of the last synchronization.
+        If it did not change, nothing gets downloaded.
+        Otherwise a sync-collection report (RFC 6578) provides the added, changed and deleted resources.
+        Only the changed resources get downloaded using a single calendar-multiget report.
+
+        The parsed events of all resources are kept in ``calendar["resources"]`` so that the event list
+        can be rebuilt for a different time window without accessing the server.
+        Recurring events are not expanded by the server in this mode.
+        They get expanded locally by a :class:`~wkserver.lib.recurrence.RecurrenceSet`.
+        If local expansion is disabled and the calendar contains recurring events,
+        the event list gets build by :meth:`SearchEvents`.
+
+        Raises:
+            caldav.lib.error.ReportError: If the server does not support sync-collection reports
+        """
+        remotecalendar = calendar["remotecalendar"]
+        resources      = calendar["resources"]
+
+        ctag = remotecalendar.get_property(GetCTag())
+        if ctag is None or ctag != calendar["ctag"]:
+            try:
+                changes = remotecalendar.objects_by_sync_token(sync_token=calendar["synctoken"])
+            except caldaverror.ReportError as e:
+                if calendar["synctoken"] is None:
+                    raise e
+                logging.debug("Sync-token of %s not accepted by the server. \033[1;30m(Doing initial sync)", calendar["name"])
+                calendar["synctoken"] = None
+                resources.clear()
+                changes = remotecalendar.objects_by_sync_token(sync_token=None)
+
+            etags   = {}
+            updates = []
+            deleted = 0
+            for remoteobject in changes:
+                href = self.ResourceHref(remoteobject)
+                etag = remoteobject.props.get(dav.GetEtag.tag)
+                if etag is None:    # Deleted resources come without properties
+                    if resources.pop(href, None) is not None:
+                        deleted += 1
+                elif href not in resources or resources[href]["etag"] != etag:
+                    etags[href] = etag
+                    updates.append(remoteobject.url)
+
+            self.FetchResources(calendar, updates, etags)
+
+            calendar["ctag"]      = ctag
+            calendar["synctoken"] = changes.sync_token
+            if updates or deleted:
+                calendar["window"] = None
+
+        elif calendar["window"] == (start, end):
+            return  # Nothing changed
+
+        self.AssembleResources(calendar, start, end)
+        return
+
+
+
+    def QueryCalendar(self, calendar, start, end):
+        """
+        Incremental update of a calendar for servers that do not support sync-collection reports.
+
+        A calendar-query report lists the ETags of all resources with events between *start* and *end*.
+        This listing does not contain any calendar data, so it is cheap for the server and the network.
+        Only resources that are new or whose ETag changed get downloaded using a single calendar-multiget report.
+        Resources that are no longer listed get removed.
+        When the window moves by a week, only the resources of the new week get downloaded
+        and the resources that only overlapped with the old week get dropped.
+        Unchanged resources inside the window just get validated by their ETag.
+        Like for :meth:`SyncCalendar`, the CTag of the calendar gets checked first.
+        If it did not change and the window did not move, the calendar-query gets skipped.
+
+        If local expansion is disabled and the calendar contains recurring events,
+        the event list gets build by :meth:`SearchEvents`.
+        """
+        remotecalendar = calendar["remotecalendar"]
+        resources      = calendar["resources"]
+
+        ctag = remotecalendar.get_property(GetCTag())
+        if ctag is not None and ctag == calendar["ctag"] and calendar["window"] == (start, end):
+            return  # Nothing changed
+
+        listing = self.ListETags(remotecalendar, start, end)
+
+        listed  = set()
+        etags   = {}
+        updates = []
+        for url, etag in listing:
+            href = unquote(str(url.path))   # Same key as returned by ResourceHref
+            listed.add(href)
+            if etag is None or href not in resources or resources[href]["etag"] != etag:
+                etags[href] = etag
+                updates.append(url)
+
+        deleted = [href for href in resources if href not in listed]
+        for href in deleted:
+            resources.pop(href)
+
+        self.FetchResources(calendar, updates, etags)
+        calendar["ctag"] = ctag
+
+        if not updates and not deleted and calendar["window"] == (start, end):
+            return  # Nothing changed
+        self.AssembleResources(calendar, start, end)
+        return
+
+
+
+    def ListETags(self, remotecalendar, start, end):
+        """
+        Lists the URLs and ETags of all resources of a remote calendar with events between *start* and *end*.
+
+        The report gets sent via the public ``DAVClient.report`` method and the ETags get extracted from its response.
+        The ``search`` method of the *caldav* module cannot be used because it always requests the calendar data as well.
+
+        Args:
+            remotecalendar: The ``caldav.Calendar`` object of the calendar
+            start (datetime): Begin of the time range
+            end (datetime): End of the time range
+
+        Returns:
+            A list of tuples of the URL of a resource and its ETag, or ``None`` if the server did not provide one
+
+        Raises:
+            caldav.lib.error.ReportError: When the server rejected the report
+        """
+        query    = self.BuildETagQuery(start, end)
+        body     = etree.tostring(query.xmlelement(), encoding="utf-8", xml_declaration=True)
+        response = remotecalendar.client.report(remotecalendar.url, body, depth=1)
+        if response.status >= 400:
+            raise caldaverror.ReportError(str(remotecalendar.url), "ETag listing failed with status %i" % (response.status))
+
+        listing = []
+        for href, props in response.expand_simple_props([dav.GetEtag()]).items():
+            url = remotecalendar.url.join(href)
+            if url == remotecalendar.url:
+                continue    # Some servers list the calendar itself, too
+            listing.append((url, props.get(dav.GetEtag.tag)))
+        return listing
+
+
+
+    def BuildETagQuery(self, start, end):
+        """
+        Returns a calendar-query report that requests the ETags of all events between *start* and *end*.
+        """
+        prop      = dav.Prop() + dav.GetEtag()
+        query     = cdav.CompFilter("VEVENT") + cdav.TimeRange(start, end)
+        vcalendar = cdav.CompFilter("VCALENDAR") + query
+        filter    = cdav.Filter() + vcalendar
+        return cdav.CalendarQuery() + [prop, filter]
+
+
+
+    def FetchResources(self, calendar, urls, etags):
+        """
+        Downloads the resources addressed by *urls* using a single calendar-multiget report
+        and stores their events in ``calendar["resources"]``.
+
+        Args:
+            calendar (dict): Internal calendar representation
+            urls (list): URLs of the resources to download
+            etags (dict): ETag of each resource, addressed by its href (See :meth:`ResourceHref`)
+
+        Returns:
+            *Nothing*
+        """
+        if not urls:
+            return
+
+        logging.debug("%i resources of %s changed", len(urls), calendar["name"])
+        resources = calendar["resources"]
+        for remoteevent in calendar["remotecalendar"].calendar_multiget(urls):
+            href = self.ResourceHref(remoteevent)
+            etag = etags.get(href)
+            resources[href] = {}
+            resources[href]["etag"]      = etag
+            resources[href]["recurring"] = self.IsRecurring(remoteevent)
+            resources[href]["series"]    = None
+            resources[href]["events"]    = []
+            if resources[href]["recurring"] and self.localexpansion:
+                resources[href]["series"] = self.ProcessRecurringEvent(remoteevent, etag)
+            if resources[href]["series"] is None:
+                resources[href]["events"] = self.ProcessRemoteEvent(remoteevent, etag)
+        return
+
+
+
+    def AssembleResources(self, calendar, start, end):
+        """
+        Builds the event list of a calendar for the window from *start* to *end* from ``calendar["resources"]``.
+        Recurring events get expanded locally.
+        If local expansion is disabled and the calendar contains recurring events,
+        the event list gets build by :meth:`SearchEvents`.
+        """
+        resources = calendar["resources"]
+        if not self.localexpansion and any(resource["recurring"] for resource in resources.values()):
+            self.SearchEvents(calendar, start, end)
+            return
+
+        eventlists = []
+        for resource in resources.values():
+            if resource["series"] is not None:
+                events = self.ExpandRecurringEvent(resource["series"], start, end)
+            else:
+                events = resource["events"]
+            eventlists.append(FilterEvents(events, start, end))
+        self.AssembleEvents(calendar, eventlists, start, end)
+        calendar["window"] = (start, end)
+        return
+
+
+
+    def UpdateCalendar(self, calendar, start, end):
+        """
+        Updates the events of a single calendar.
+        This method blocks until all requests to the server are done.
+        If accessing the calendar fails, the last good events remain and the calendar gets marked as stale.
+
+        Returns:
+            ``True`` on success, otherwise ``False``
+        """
+        name = calendar["name"]
+        try:
+            self.FetchCalendar(calendar, start, end)
+        except Exception as e:
+            logging.warning("Accessing %s failed with error %s! \033[0m(Last good data will be used)",
+                    str(name), str(e))
+            if calendar["events"] is None:
+                calendar["events"] = []
+            calendar["window"] = None
+            calendar["stale"]  = True
             return False
 
-        for name, calendar in self.calendars.items():
-            for remotecalendar in remotecalendars:
-                if calendar["remotename"] == remotecalendar.name:
-                    calendar["remotecalendar"] = remotecalendar
+        calendar["updated"] = time.time()
+        calendar["stale"]   = False
         return True
 
 
 
-    def ProcessRemoteEvent(self, remoteevent):
-        ical   = Calendar.from_ical(remoteevent.data)
-        events = []
-        for component in ical.walk():
-            if component.name != "VEVENT":
-                continue
-            event = {}
-            event["start"] = component.decoded("DTSTART")
-            event["end"]   = component.decoded("DTEND")
-            event["start"] = str(event["start"])
-            event["end"]   = str(event["end"]  )
-            if type(component.decoded("DTSTART")) == date:
-                event["allday"]= True
-            else:
-                event["allday"]= False
+    def FetchCalendar(self, calendar, start, end):
+        """
+        Updates the events of a single calendar using the best method the server supports:
+        :meth:`SyncCalendar`, :meth:`QueryCalendar` or :meth:`SearchEvents`.
 
+        Raises:
+            Exceptions of the *caldav* module when accessing the server fails
+        """
+        name = calendar["name"]
+        if calendar["syncable"]:
             try:
-                event["summary"] = component.decoded("SUMMARY").decode("utf-8")
-            except KeyError as e:
-                logging.error("Key Error: \"SUMMARY\" not found for event at %s!", event["start"])
-                event["summary"] = "Error: Fehlender Termin-Titel!"
-            events.append(event)
+                self.SyncCalendar(calendar, start, end)
+                return
+            except caldaverror.ReportError as e:
+                logging.warning("Server does not support incremental synchronization of %s (%s). \033[1;30m(Falling back to ETag queries)",
+                        str(name), str(e))
+                calendar["syncable"] = False
 
-        return events
+        if calendar["queryable"]:
+            try:
+                self.QueryCalendar(calendar, start, end)
+                return
+            except caldaverror.ReportError as e:
+                logging.warning("Server does not support ETag queries of %s (%s). \033[1;30m(Falling back to full updates)",
+                        str(name), str(e))
+                calendar["queryable"] = False
+                calendar["resources"].clear()
 
+        self.SearchEvents(calendar, start, end)
+        return
 
 
-    def GetEvents(self, start, end):
-        logging.debug("Get events from %s to %s", str(start), str(end))
+
+    def GetSnapshot(self):
+        """
+        Returns the state of all calendars that have valid events as JSON serializable dictionary.
+        Beside the events, the state for the incremental synchronization gets included (CTag, sync-token and the ETags of the resources).
+        Recurring events get stored as raw iCalendar data, so that their :class:`~wkserver.lib.recurrence.RecurrenceSet` can be recreated.
+
+        This method must not be called while a calendar gets updated.
+        """
+        state = {}
+        state["expansion"] = self.config.data.expansion
+        state["calendars"] = {}
         for name, calendar in self.calendars.items():
+            index = calendar["index"]
+            if index is None:
+                continue
+
+            resources = {}
+            for href, resource in calendar["resources"].items():
+                resources[href] = {}
+                resources[href]["etag"]      = resource["etag"]
+                resources[href]["recurring"] = resource["recurring"]
+                resources[href]["events"]    = [event.Pack() for event in resource["events"]]
+                if resource["series"] is not None:
+                    resources[href]["data"]  = resource["series"].data
+                else:
+                    resources[href]["data"]  = None
+
+            entry = {}
+            entry["remoteurl"] = calendar["remoteurl"]
+            entry["updated"]   = calendar["updated"]
+            entry["ctag"]      = calendar["ctag"]
+            entry["synctoken"] = calendar["synctoken"]
+            entry["start"]     = index.start.isoformat()
+            entry["end"]       = index.end.isoformat()
+            entry["events"]    = [event.Pack() for event in index.events]
+            entry["resources"] = resources
+            state["calendars"][name] = entry
+        return state
+
+
+
+    def RestoreSnapshot(self, state):
+        """
+        Restores the state of the calendars from a snapshot created by :meth:`GetSnapshot`.
+        Calendars that are no longer configured are ignored.
+        If the snapshot was created with a different ``[data]->expansion`` setting, it gets ignored completely.
+
+        Returns:
+            A list with the names of the restored calendars
+        """
+        if state.get("expansion") != self.config.data.expansion:
+            logging.info("Snapshot was created with a different expansion setting. \033[1;30m(Snapshot will be ignored)")
+            return []
+
+        restored = []
+        for name, entry in state.get("calendars", {}).items():
+            calendar = self.calendars.get(name)
+            if calendar is None:
+                continue
+
             try:
-                remoteevents = calendar["remotecalendar"].date_search(start=start, end=end, expand=True)
-                #remoteevents = calendar["remotecalendar"].search(start=start, end=end, expand=True)
+                resources = {}
+                for href, resource in entry["resources"].items():
+                    resources[href] = {}
+                    resources[href]["etag"]      = resource["etag"]
+                    resources[href]["recurring"] = resource["recurring"]
+                    resources[href]["events"]    = [Event.Unpack(values) for values in resource["events"]]
+                    resources[href]["series"]    = None
+                    if resource["data"] is not None:
+                        series = self.RecurringSeries(href, resource["data"], resource["etag"])
+                        if series is None:
+                            raise ValueError("Invalid recurring event %s" % href)
+                        resources[href]["series"] = series
+
+                start  = datetime.fromisoformat(entry["start"])
+                end    = datetime.fromisoformat(entry["end"])
+                events = [Event.Unpack(values) for values in entry["events"]]
             except Exception as e:
-                logging.warning("Accessing %s failed with error %s! \033[0m(Calendar will be ignored this time)",
-                        str(name), str(e))
-                remoteevents = []
-
-            calendar["events"] = []
-            for remoteevent in remoteevents:
-                events = self.ProcessRemoteEvent(remoteevent)
-
-                for event in events:
-                    # If all-day and start<end, expand
-                    if event["allday"] == True and event["start"] != event["end"]:
-                        startdate = datetime.strptime(event["start"], "%Y-%m-%d").date()
-                        while event["start"] < event["end"]:
-                            calendar["events"].append(dict(event))  # append a copy
-                            startdate += timedelta(days=1)
-                            event["start"] = str(startdate)
-                    else:
-                        calendar["events"].append(event)
-
-                # Sort by date and time
-                calendar["events"].sort(key=lambda event: event["start"])
-        return
+                logging.warning("Restoring %s from the snapshot failed with error %s! \033[1;30m(Calendar will be updated from the server)", name, str(e))
+                continue
+
+            calendar["remoteurl"] = entry.get("remoteurl")
+            calendar["updated"]   = entry.get("updated")
+            calendar["stale"]     = True    # Until the first successful update
+            calendar["ctag"]      = entry["ctag"]
+            calendar["synctoken"] = entry["synctoken"]
+            calendar["resources"] = resources
+            calendar["events"]    = events
+            calendar["index"]     = EventIndex(events, start, end)
+            calendar["window"]    = (start, end)
+            restored.append(name)
+        return restored
 
 
 
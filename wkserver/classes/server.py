@@ -54,11 +54,10 @@ The following example shows how to use the pipe interface:
 
 import traceback
 import random
-import time
 import signal
 import logging
 from wkserver.lib.ws.server      import WKServerWebSocketServer
-from wkserver.classes.calendarclient import CalendarClientManager, StartCalendarClientThread
+from wkserver.classes.calendarclient import CalendarClientManager, StartCalendarFetcher
 
 
 class WKServer(object):
@@ -69,20 +68,24 @@ class WKServer(object):
 
 
 
-    def SignalHandler(self, signum, stack):
+    def SignalHandler(self, signum):
         """
         This is the general signal handle for the MusicDB Server.
         This function reacts on system signals and calls the handler of a specific signal.
+        It gets called inside the event loop (See :meth:`~Run`).
 
         Args:
             signum: signal number
-            stack: current stack frame
         
         Returns: Nothing
         """
         if signum == signal.SIGTERM:
             logging.debug("Got signal TERM")
             self.SIGTERM_Handler()
+        elif signum == signal.SIGINT:
+            logging.warning("user initiated server shutdown");
+            self.shutdown = True     # signal that this is a correct shutdown and no crash
+            self.tlswsserver.StopRunning()
         else:
             logging.warning("Got unexpected signal %s"%str(signum))
 
@@ -91,10 +94,11 @@ class WKServer(object):
     def SIGTERM_Handler(self):
         """
         This function is the handler for the system signal TERM.
-        It signals the server to shut down.
+        It signals the server to shut down by stopping the event loop.
         """
         logging.info("\033[1;36mSIGTERM:\033[1;34m Initiate Shutdown …\033[0m")
         self.shutdown = True
+        self.tlswsserver.StopRunning()
 
 
 
@@ -105,10 +109,6 @@ class WKServer(object):
         """
 
         random.seed()
-        
-        # Signal Handler
-        # The user shall use the FIFO
-        signal.signal(signal.SIGTERM, self.SignalHandler)
         return None
 
 
@@ -131,12 +131,19 @@ class WKServer(object):
             logging.critical("Setup for websocket server failed!")
             return False
 
+        self.tlswsserver.factory.allowbinary = self.config.websocket.binary
+        if self.config.websocket.compression:
+            self.tlswsserver.factory.SetupCompression(
+                    self.config.websocket.contexttakeover,
+                    self.config.websocket.windowbits,
+                    self.config.websocket.compressionthreshold)
+
         retval = self.tlswsserver.Start()
         if retval == False:
             logging.critical("Starting websocket server failed!")
             return False
 
-        StartCalendarClientThread(self.config)
+        StartCalendarFetcher(self.config, self.tlswsserver.eventloop)
         return True
 
 
@@ -150,14 +157,14 @@ class WKServer(object):
         if self.tlswsserver:
             logging.debug("Disconnect from clients…")
             self.tlswsserver.factory.CloseConnections()
+
+        calendar = CalendarClientManager()
+        calendar.Stop()
         
         if self.tlswsserver:
             logging.debug("Stopping TLS WS Server…")
             self.tlswsserver.Stop()
 
-        calendar = CalendarClientManager()
-        calendar.StopThread()
-
         # dead end
         if self.shutdown:
             exit(0)
@@ -169,6 +176,8 @@ class WKServer(object):
     def Run(self):
         """
         This is the servers main loop.
+        It runs the event loop of the websocket server until a SIGTERM or SIGINT signal arrives.
+        The signals are handled inside the event loop, so the loop only wakes up when there is something to do.
         """
         logging.info("Setup complete. \033[1;37mExecuting server.\033[1;34m")
         # enter event loop
@@ -176,26 +185,21 @@ class WKServer(object):
             logging.critical("TLS Websocket Server was not started!")
             return
 
-        try:
-
-            while True:
-                self.tlswsserver.HandleEvents()
-                
-                if self.shutdown:
-                    self.Shutdown()
+        eventloop = self.tlswsserver.eventloop
+        eventloop.add_signal_handler(signal.SIGTERM, self.SignalHandler, signal.SIGTERM)
+        eventloop.add_signal_handler(signal.SIGINT,  self.SignalHandler, signal.SIGINT)
 
-                time.sleep(.1)  # Avoid high CPU load
-
-        except KeyboardInterrupt:
-            logging.warning("user initiated server shutdown");
-            self.shutdown = True     # signal that this is a correct shutdown and no crash
-            self.Shutdown()
+        try:
+            self.tlswsserver.Run()
 
         except Exception as e:
             logging.critical("FATAL ERROR (shutting down server!!):");
             logging.critical(e)
             traceback.print_exc()
-            self.Shutdown()
+
+        eventloop.remove_signal_handler(signal.SIGTERM)
+        eventloop.remove_signal_handler(signal.SIGINT)
+        self.Shutdown()
 
 # vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
 
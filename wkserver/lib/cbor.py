@@ -0,0 +1,141 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module encodes data in the Concise Binary Object Representation (CBOR) as defined in RFC 8949.
+It is used for the binary encoding of the packets sent to the clients (See :mod:`wkserver.lib.ws.websocket`).
+
+Only the data types of JSON are supported, so each packet can be encoded either way:
+
+    ==================  ======================================
+    Python              CBOR
+    ==================  ======================================
+    ``None``            simple value *null*
+    ``bool``            simple value *true* or *false*
+    ``int``             unsigned or negative integer (64 bit)
+    ``float``           double precision float
+    ``str``             UTF-8 text string
+    ``bytes``           byte string
+    ``list``, ``tuple`` array
+    ``dict``            map
+    ==================  ======================================
+
+All items are encoded with definite length.
+The matching decoder for the web front end is ``DecodeCBOR`` in ``WandKalender2/js/WebSockets.js``.
+
+    .. code-block:: python
+
+        rawdata = EncodeCBOR({"name": "Holidays", "events": []})
+"""
+
+import struct
+
+MAJOR_UNSIGNED = 0
+MAJOR_NEGATIVE = 1
+MAJOR_BYTES    = 2
+MAJOR_TEXT     = 3
+MAJOR_ARRAY    = 4
+MAJOR_MAP      = 5
+
+SIMPLE_FALSE   = 0xF4
+SIMPLE_TRUE    = 0xF5
+SIMPLE_NULL    = 0xF6
+FLOAT64        = 0xFB
+
+
+
+def EncodeCBOR(value):
+    """
+    Encodes a value as CBOR data item.
+
+    Args:
+        value: A JSON compatible value (See the module description)
+
+    Returns:
+        The encoded value as ``bytes``
+
+    Raises:
+        TypeError: If the value or one of its elements cannot be encoded
+        ValueError: If an integer does not fit into 64 bit
+    """
+    output = bytearray()
+    EncodeItem(output, value)
+    return bytes(output)
+
+
+
+def EncodeHead(output, majortype, argument):
+    """
+    Appends the initial byte of a data item and its argument (the value, length or number of elements).
+    """
+    if argument < 24:
+        output.append(majortype << 5 | argument)
+    elif argument < 0x100:
+        output.append(majortype << 5 | 24)
+        output.append(argument)
+    elif argument < 0x10000:
+        output.append(majortype << 5 | 25)
+        output += struct.pack(">H", argument)
+    elif argument < 0x100000000:
+        output.append(majortype << 5 | 26)
+        output += struct.pack(">I", argument)
+    elif argument < 0x10000000000000000:
+        output.append(majortype << 5 | 27)
+        output += struct.pack(">Q", argument)
+    else:
+        raise ValueError("Integer %i does not fit into 64 bit" % (argument))
+
+
+
+def EncodeItem(output, value):
+    """
+    Appends the encoded *value* to the bytearray *output*.
+    """
+    valuetype = type(value)
+    if value is None:
+        output.append(SIMPLE_NULL)
+    elif valuetype is bool:
+        output.append(SIMPLE_TRUE if value else SIMPLE_FALSE)
+    elif valuetype is int:
+        if value >= 0:
+            EncodeHead(output, MAJOR_UNSIGNED, value)
+        else:
+            EncodeHead(output, MAJOR_NEGATIVE, -1 - value)
+    elif valuetype is float:
+        output.append(FLOAT64)
+        output += struct.pack(">d", value)
+    elif valuetype is str:
+        data = value.encode("utf-8")
+        EncodeHead(output, MAJOR_TEXT, len(data))
+        output += data
+    elif valuetype is bytes or valuetype is bytearray:
+        EncodeHead(output, MAJOR_BYTES, len(value))
+        output += value
+    elif valuetype is list or valuetype is tuple:
+        EncodeHead(output, MAJOR_ARRAY, len(value))
+        for element in value:
+            EncodeItem(output, element)
+    elif valuetype is dict:
+        EncodeHead(output, MAJOR_MAP, len(value))
+        for key, element in value.items():
+            EncodeItem(output, key)
+            EncodeItem(output, element)
+    else:
+        raise TypeError("Values of type %s cannot be encoded as CBOR" % (str(valuetype)))
+    return
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -97,8 +97,20 @@ class WKServerConfig(Config):
         self.websocket.port         = self.Get(int, "websocket","port",         9000)
         self.websocket.url          = self.Get(str, "websocket","url",          "wss://localhost:9000")
         self.websocket.apikey       = self.Get(str, "websocket","apikey",       None)
+        self.websocket.keepalive    = self.Get(int, "websocket","keepalive",    30)
         if not self.websocket.apikey:
             logging.warning("Value of [websocket]->apikey is not set!")
+        if self.websocket.keepalive < 0:
+            logging.error("Invalid value for [websocket]->keepalive. It must be 0 (disabled) or more seconds. \033[1;30m(Using 30)")
+            self.websocket.keepalive = 30
+        self.websocket.binary               = self.Get(bool,"websocket","binary",               True)
+        self.websocket.compression          = self.Get(bool,"websocket","compression",          True)
+        self.websocket.contexttakeover      = self.Get(bool,"websocket","contexttakeover",      True)
+        self.websocket.windowbits           = self.Get(int, "websocket","windowbits",           15)
+        self.websocket.compressionthreshold = self.Get(int, "websocket","compressionthreshold", 256)
+        if self.websocket.windowbits < 9 or self.websocket.windowbits > 15:
+            logging.error("Invalid value for [websocket]->windowbits. It must be in range of 9 to 15. \033[1;30m(Using 15)")
+            self.websocket.windowbits = 15
 
 
         # [caldav]
@@ -106,14 +118,51 @@ class WKServerConfig(Config):
         self.caldav.username     = self.Get(str, "caldav","username",          "user")
         self.caldav.password     = self.Get(str, "caldav","password",          "password")
         self.caldav.url          = self.Get(str, "caldav","url",               "https://localhost:443")
+        self.caldav.workers      = self.Get(int, "caldav","workers",           4)
+        self.caldav.maxperhost   = self.Get(int, "caldav","maxperhost",        2)
+        self.caldav.rediscover   = self.Get(int, "caldav","rediscover",        21600)  # 6h
+        self.caldav.poolsize     = self.Get(int, "caldav","poolsize",          self.caldav.workers)
+        self.caldav.keepalive    = self.Get(bool,"caldav","keepalive",         True)
+        self.caldav.accounts     = self.Get(str, "caldav","accounts",          [], islist=True)   # Additional [caldav:<name>] sections
+        if self.caldav.rediscover < 60:
+            logging.error("Invalid value for [caldav]->rediscover. It must be at least 60 seconds. \033[1;30m(Using 60)")
+            self.caldav.rediscover = 60
+        if self.caldav.workers < 1 or self.caldav.maxperhost < 1 or self.caldav.poolsize < 1:
+            logging.error("Invalid value for [caldav]->workers, [caldav]->maxperhost or [caldav]->poolsize. All must be at least 1. \033[1;30m(Using 1 instead)")
+            self.caldav.workers    = max(1, self.caldav.workers)
+            self.caldav.maxperhost = max(1, self.caldav.maxperhost)
+            self.caldav.poolsize   = max(1, self.caldav.poolsize)
 
 
         # [data]
         self.data = DATA()
         self.data.updaterate    = self.Get(int, "data", "updaterate",       30)
-        self.data.interdatadelay= self.Get(int, "data", "interdatadelay",    1)
+        self.data.maxupdaterate = self.Get(int, "data", "maxupdaterate",  7200)   # 2h
+        if self.data.updaterate < 1:
+            logging.error("Invalid value for [data]->updaterate. It must be at least 1. \033[1;30m(Using 30)")
+            self.data.updaterate = 30
+        if self.data.maxupdaterate < self.data.updaterate:
+            logging.error("Invalid value for [data]->maxupdaterate. It must not be less than [data]->updaterate. \033[1;30m(Using [data]->updaterate)")
+            self.data.maxupdaterate = self.data.updaterate
+        self.data.failurethreshold = self.Get(int, "data", "failurethreshold", 3)
+        if self.data.failurethreshold < 1:
+            logging.error("Invalid value for [data]->failurethreshold. It must be at least 1. \033[1;30m(Using 1)")
+            self.data.failurethreshold = 1
         self.data.past          = self.Get(int, "data", "past",              0)
         self.data.future        = self.Get(int, "data", "future",            4)
+        self.data.incremental   = self.Get(bool,"data", "incremental",    True)
+        self.data.cachesize     = self.Get(int, "data", "cachesize",      4096)   # KiB
+        self.data.parser        = self.Get(str, "data", "parser",   "icalendar")
+        if not self.data.parser in ["icalendar", "fast"]:
+            logging.error("Invalid value for [data]->parser. It must be \"icalendar\" or \"fast\". \033[1;30m(Using \"icalendar\")")
+            self.data.parser = "icalendar"
+        self.data.snapshot      = self.Get(str, "data", "snapshot", "/var/lib/wkserver/snapshot.json.gz")
+        if not self.data.snapshot or self.data.snapshot == "/dev/null":
+            self.data.snapshot = None
+        self.data.expansion     = self.Get(str, "data", "expansion",    "local")
+        if not self.data.expansion in ["local", "server"]:
+            logging.error("Invalid value for [data]->expansion. It must be \"local\" or \"server\". \033[1;30m(Using \"local\")")
+            self.data.expansion = "local"
 
 
         # [TLS]
@@ -0,0 +1,293 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module provides the compact internal representation of an event.
+
+Start and end of an event are stored as integer POSIX timestamps (seconds since 1970-01-01 00:00 UTC).
+For all-day events the timestamps address 00:00 UTC of the respective date.
+So they are ordinal day numbers scaled by :data:`DAY`, independent from any time zone.
+Floating date-times (without time zone) are interpreted in the local time zone of the server.
+
+The event gets converted into the format sent to the clients only when it gets sent.
+"""
+
+import sys
+import bisect
+import itertools
+import operator
+from datetime import date, datetime, time
+
+DAY           = 24*60*60
+EPOCHORDINAL  = date(1970, 1, 1).toordinal()
+STARTKEY      = operator.attrgetter("start")
+LONGDURATION  = 2*DAY  # Events longer than this are handled separately by the EventIndex
+
+
+
+def DateToTimestamp(value):
+    """
+    Returns the timestamp of 00:00 UTC of a date.
+    """
+    return (value.toordinal() - EPOCHORDINAL) * DAY
+
+def TimestampToDate(timestamp):
+    """
+    Inverse of :meth:`~DateToTimestamp`.
+    """
+    return date.fromordinal(timestamp // DAY + EPOCHORDINAL)
+
+
+
+def DayRange(start, end):
+    """
+    Returns the range of dates all-day events must overlap with to overlap with the time from *start* to *end*.
+    A range ending after midnight includes the day it ends on.
+
+    Returns:
+        A tuple ``(start, end)`` of timestamps as returned by :meth:`~DateToTimestamp`
+    """
+    daystart = DateToTimestamp(start.date())
+    dayend   = DateToTimestamp(end.date())
+    if end.time() != time():
+        dayend += DAY
+    return daystart, dayend
+
+
+
+def AssembleEvents(eventlists):
+    """
+    Combines the event lists of several calendar object resources into one list ordered by the start of the events.
+
+    All lists get concatenated and sorted once by the integer start timestamps.
+    The sort algorithm detects already ordered runs, so ordered input lists only get merged.
+    Events with the same start keep the order of *eventlists*.
+
+    Args:
+        eventlists (list): A list of lists of :class:`~Event` objects
+
+    Returns:
+        A new list with all events
+    """
+    events = list(itertools.chain.from_iterable(eventlists))
+    events.sort(key=STARTKEY)
+    return events
+
+
+
+def FilterEvents(events, start, end):
+    """
+    Returns the events that overlap with the time from *start* to *end*.
+    All-day events that overlap with the dates of *start* and *end* are included.
+    Like CalDAV time ranges, the range is half-open:
+    Events ending at *start* are not included, except events without duration that start at *start*.
+
+    Args:
+        events: An iterable of :class:`~Event` objects
+        start (datetime): Begin of the range (naive, local time)
+        end (datetime): End of the range (naive, local time)
+
+    Returns:
+        A list of the overlapping events in the order of *events*
+    """
+    timedstart = start.timestamp()
+    timedend   = end.timestamp()
+    daystart, dayend = DayRange(start, end)
+
+    filtered = []
+    for event in events:
+        if event.allday:
+            if event.start < dayend and (event.end > daystart or event.start >= daystart):
+                filtered.append(event)
+        elif event.start < timedend and (event.end > timedstart or (event.start == event.end and event.start >= timedstart)):
+            filtered.append(event)
+    return filtered
+
+
+
+class Event(object):
+    """
+    Args:
+        start (int): Start timestamp
+        end (int): End timestamp (exclusive)
+        allday (bool): ``True`` for all-day events
+        summary (str): Title of the event. It gets interned because the same titles appear many times.
+    """
+    __slots__ = ("start", "end", "allday", "summary")
+
+    def __init__(self, start, end, allday, summary):
+        self.start   = start
+        self.end     = end
+        self.allday  = allday
+        self.summary = sys.intern(summary)
+
+
+
+    @classmethod
+    def FromValues(cls, start, end, summary):
+        """
+        Creates an event from decoded iCalendar values.
+
+        Args:
+            start: ``date`` or ``datetime`` of the begin
+            end: ``date`` or ``datetime`` of the end
+            summary (str): Title of the event
+
+        Returns:
+            A new :class:`~Event` object
+        """
+        if type(start) == date:
+            return cls(DateToTimestamp(start), DateToTimestamp(end), True, summary)
+        return cls(int(start.timestamp()), int(end.timestamp()), False, summary)
+
+
+
+    @classmethod
+    def Unpack(cls, values):
+        """
+        Creates an event from the list returned by :meth:`~Pack`.
+        """
+        start, end, allday, summary = values
+        return cls(start, end, allday, summary)
+
+
+
+    def Pack(self):
+        """
+        Returns the event as compact list that can be serialized as JSON.
+        """
+        return [self.start, self.end, self.allday, self.summary]
+
+
+
+    def ToDict(self):
+        """
+        Returns the event in the format it gets sent to the clients.
+        Date-times are represented in the local time zone of the server.
+        """
+        if self.allday:
+            start = str(TimestampToDate(self.start))
+            end   = str(TimestampToDate(self.end))
+        else:
+            start = str(datetime.fromtimestamp(self.start).astimezone())
+            end   = str(datetime.fromtimestamp(self.end).astimezone())
+
+        event = {}
+        event["start"]   = start
+        event["end"]     = end
+        event["allday"]  = self.allday
+        event["summary"] = self.summary
+        return event
+
+
+
+    def __eq__(self, other):
+        if not isinstance(other, Event):
+            return NotImplemented
+        return (self.start, self.end, self.allday, self.summary) == (other.start, other.end, other.allday, other.summary)
+
+    def __hash__(self):
+        return hash((self.start, self.end, self.allday, self.summary))
+
+    def __repr__(self):
+        return "Event(%s)" % str(self.ToDict())
+
+
+
+class EventIndex(object):
+    """
+    This class answers the question which events overlap with a range in logarithmic time.
+
+    The events must be sorted by their start (See :meth:`~AssembleEvents`).
+    A range query searches the first event that may overlap via bisection
+    and the first event starting after the range.
+    Only the events in between get checked by :meth:`~FilterEvents`.
+    Events that started up to the longest duration of all events before the range may still overlap,
+    so the search starts that long before the range.
+
+    A single long event like a vacation would widen every search that way.
+    So events longer than :data:`LONGDURATION` are kept in a separate list that gets checked completely.
+    Usually there are only a few of them.
+
+    The index covers only the range the events got assembled for.
+    Queries get clipped to that range.
+    The index is immutable, so it can be shared between threads.
+
+    Args:
+        events (list): Sorted list of :class:`~Event` objects
+        start (datetime): Begin of the range the events got assembled for
+        end (datetime): End of the range the events got assembled for
+    """
+    def __init__(self, events, start, end):
+        self.events        = events
+        self.start         = start
+        self.end           = end
+        self.starts        = []     # Start of each short event
+        self.positions     = []     # Position of each short event in events
+        self.longpositions = []     # Position of each long event in events
+        self.maxduration   = 0      # Longest duration of the short events
+
+        for position, event in enumerate(events):
+            duration = event.end - event.start
+            if duration > LONGDURATION:
+                self.longpositions.append(position)
+            else:
+                self.starts.append(event.start)
+                self.positions.append(position)
+                self.maxduration = max(self.maxduration, duration)
+
+
+
+    def Clip(self, start, end):
+        """
+        Returns the part of the range from *start* to *end* that is covered by the index.
+
+        Returns:
+            A tuple ``(start, end)`` or ``None`` if the ranges do not overlap
+        """
+        start = max(start, self.start)
+        end   = min(end,   self.end)
+        if start >= end:
+            return None
+        return start, end
+
+
+
+    def Overlapping(self, start, end):
+        """
+        Returns all events that overlap with the range from *start* to *end*.
+        The range must be inside the range of the index (See :meth:`~Clip`).
+
+        Args:
+            start (datetime): Begin of the range (naive, local time)
+            end (datetime): End of the range (naive, local time)
+
+        Returns:
+            A list of :class:`~Event` objects sorted by their start
+        """
+        daystart, dayend = DayRange(start, end)
+        lower = min(daystart, int(start.timestamp())) - self.maxduration
+        upper = max(dayend,   int(end.timestamp()) + 1)
+        first = bisect.bisect_left(self.starts, lower)
+        last  = bisect.bisect_left(self.starts, upper, first)
+
+        candidates = self.positions[first:last]
+        if self.longpositions:
+            candidates = sorted(candidates + self.longpositions)
+        return FilterEvents([self.events[position] for position in candidates], start, end)
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
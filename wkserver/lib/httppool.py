@@ -0,0 +1,88 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module provides an explicitly configured connection pool for the HTTP session of the *caldav* module.
+
+The *caldav* module uses a ``requests.Session``.
+A :class:`~PooledHTTPAdapter` mounted to that session keeps up to *poolsize* connections to each host open,
+so that following requests reuse an established TCP connection and its TLS session instead of doing a new handshake.
+Optionally TCP keep-alive packets keep idle connections (and NAT entries) alive between two updates.
+
+    .. code-block:: python
+
+        adapter = PooledHTTPAdapter(poolsize=4, keepalive=True)
+        davclient.session.mount("https://", adapter)
+        davclient.session.mount("http://",  adapter)
+
+        opened, requests = adapter.Statistics()
+"""
+
+import socket
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+
+KEEPALIVEIDLE     = 60  # Seconds a connection is idle before sending keep-alive packets
+KEEPALIVEINTERVAL = 30  # Seconds between two keep-alive packets
+
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    Args:
+        poolsize (int): Maximum number of connections kept open for each host
+        keepalive (bool): Enable TCP keep-alive for the connections
+    """
+    def __init__(self, poolsize, keepalive):
+        self.socketoptions = list(HTTPConnection.default_socket_options)
+        if keepalive:
+            self.socketoptions.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+            if hasattr(socket, "TCP_KEEPIDLE"):     # Not available on all platforms
+                self.socketoptions.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE,  KEEPALIVEIDLE))
+                self.socketoptions.append((socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, KEEPALIVEINTERVAL))
+
+        HTTPAdapter.__init__(self, pool_connections=poolsize, pool_maxsize=poolsize, pool_block=True)
+
+
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = self.socketoptions
+        return HTTPAdapter.init_poolmanager(self, *args, **kwargs)
+
+
+
+    def Statistics(self):
+        """
+        Returns the number of connections that got opened and the number of requests that were sent via all pools of this adapter.
+        The difference is the number of requests that reused an open connection.
+        Pools that got discarded by the pool manager are not included.
+
+        Returns:
+            A tuple ``(opened, requests)``
+        """
+        opened   = 0
+        requests = 0
+        pools    = self.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened   += pool.num_connections
+            requests += pool.num_requests
+        return opened, requests
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,244 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module extracts the events from iCalendar data.
+Only the properties the WandKalender displays are extracted: ``DTSTART``, ``DTEND`` and ``SUMMARY``.
+
+There are two implementations that return the same results:
+
+    * :meth:`~ParseEvents` uses the *icalendar* module and builds the whole component tree
+    * :meth:`~ScanEvents` is a single pass line scanner that only looks at the relevant properties.
+
+:meth:`~ScanEvents` raises a ``ValueError`` whenever it finds something it does not understand.
+In this case :meth:`~ParseEvents` should be used as fallback:
+
+    .. code-block:: python
+
+        try:
+            events = ScanEvents(data)
+        except ValueError:
+            events = ParseEvents(data)
+
+Each event is a :class:`wkserver.lib.event.Event` object.
+"""
+
+import logging
+from datetime import date, datetime, timezone
+from zoneinfo import ZoneInfo
+from icalendar import Calendar
+from wkserver.lib.event import Event
+
+MISSINGSUMMARY = "Error: Fehlender Termin-Titel!"
+
+
+
+def ParseEvents(data):
+    """
+    Extracts all events using the *icalendar* module.
+
+    Args:
+        data (str): iCalendar data
+
+    Returns:
+        A list of :class:`~wkserver.lib.event.Event` objects
+    """
+    ical   = Calendar.from_ical(data)
+    events = []
+    for component in ical.walk():
+        if component.name != "VEVENT":
+            continue
+        start = component.decoded("DTSTART")
+        end   = component.decoded("DTEND")
+
+        try:
+            summary = component.decoded("SUMMARY").decode("utf-8")
+        except KeyError:
+            logging.error("Key Error: \"SUMMARY\" not found for event at %s!", str(start))
+            summary = MISSINGSUMMARY
+        events.append(Event.FromValues(start, end, summary))
+
+    return events
+
+
+
+def ScanEvents(data):
+    """
+    Extracts all events by scanning the iCalendar data line by line.
+    Properties of components nested inside a ``VEVENT`` (like ``VALARM``) are ignored.
+
+    Args:
+        data (str): iCalendar data
+
+    Returns:
+        A list of :class:`~wkserver.lib.event.Event` objects
+
+    Raises:
+        ValueError: If the data contains something this scanner cannot handle
+    """
+    # Unfold lines (RFC 5545, 3.1)
+    data  = data.replace("\r\n", "\n").replace("\n ", "").replace("\n\t", "")
+
+    events     = []
+    properties = None   # Relevant properties of the current VEVENT
+    depth      = 0      # Nesting level of components inside the current VEVENT
+    for line in data.split("\n"):
+        colon = line.find(":")
+        if colon < 0:
+            if line.strip():
+                raise ValueError("Invalid content line: %s" % line)
+            continue
+        semicolon = line.find(";", 0, colon)
+        if semicolon < 0:
+            name = line[:colon].upper()
+        else:
+            name = line[:semicolon].upper()
+
+        if name == "BEGIN":
+            if properties is not None:
+                depth += 1
+            elif line[colon+1:].strip().upper() == "VEVENT":
+                properties = {}
+
+        elif name == "END":
+            if properties is None:
+                continue
+            if depth > 0:
+                depth -= 1
+                continue
+            events.append(MakeEvent(properties))
+            properties = None
+
+        elif properties is not None and depth == 0 and name in ("DTSTART", "DTEND", "SUMMARY"):
+            if name in properties:
+                raise ValueError("Property %s defined multiple times" % name)
+            properties[name] = SplitContentLine(line, colon, semicolon)
+
+    if properties is not None:
+        raise ValueError("VEVENT not terminated")
+    return events
+
+
+
+def SplitContentLine(line, colon, semicolon):
+    """
+    Splits a content line into its parameters and its value.
+    *colon* and *semicolon* are the positions of the first colon and of the first semicolon before that colon (or -1).
+
+    Returns:
+        A tuple of a parameter dictionary with upper case names and the raw value string
+    """
+    if semicolon < 0:
+        return {}, line[colon+1:]
+
+    if '"' in line[semicolon:colon]:
+        # A quoted parameter value may contain colons
+        quoted = False
+        for index in range(semicolon, len(line)):
+            character = line[index]
+            if character == '"':
+                quoted = not quoted
+            elif character == ":" and not quoted:
+                colon = index
+                break
+        else:
+            raise ValueError("Invalid content line: %s" % line)
+
+    parameters = {}
+    for parameter in line[semicolon+1:colon].split(";"):
+        key, separator, value = parameter.partition("=")
+        if not separator:
+            raise ValueError("Invalid parameter: %s" % parameter)
+        parameters[key.upper()] = value.strip('"')
+    return parameters, line[colon+1:]
+
+
+
+def MakeEvent(properties):
+    """
+    Creates an :class:`~wkserver.lib.event.Event` from the raw properties of a VEVENT.
+    """
+    try:
+        startparameters, startvalue = properties["DTSTART"]
+        endparameters,   endvalue   = properties["DTEND"]
+    except KeyError:
+        raise ValueError("DTSTART or DTEND missing")
+
+    start = DecodeDateTime(startparameters, startvalue)
+    end   = DecodeDateTime(endparameters,   endvalue)
+    if type(start) != type(end):
+        raise ValueError("DTSTART and DTEND have different value types")
+
+    if "SUMMARY" in properties:
+        summary = DecodeText(properties["SUMMARY"][1])
+    else:
+        logging.error("Key Error: \"SUMMARY\" not found for event at %s!", str(start))
+        summary = MISSINGSUMMARY
+    return Event.FromValues(start, end, summary)
+
+
+
+def DecodeDateTime(parameters, value):
+    """
+    Decodes a ``DATE`` or ``DATE-TIME`` value.
+    Date-times can be floating, UTC or have a ``TZID`` parameter that names an IANA time zone.
+
+    Returns:
+        A ``date`` or ``datetime`` object
+    """
+    valuetype = parameters.get("VALUE", "DATE-TIME").upper()
+    if valuetype == "DATE" or (len(value) == 8 and valuetype == "DATE-TIME" and "TZID" not in parameters):
+        if len(value) != 8:
+            raise ValueError("Invalid date: %s" % value)
+        return date(int(value[0:4]), int(value[4:6]), int(value[6:8]))
+
+    if valuetype != "DATE-TIME" or len(value) not in (15, 16) or value[8] != "T":
+        raise ValueError("Unsupported date-time: %s" % value)
+
+    if value[-1] == "Z":
+        if "TZID" in parameters:
+            raise ValueError("UTC date-time with TZID: %s" % value)
+        tzinfo = timezone.utc
+    elif len(value) != 15:
+        raise ValueError("Invalid date-time: %s" % value)
+    elif "TZID" in parameters:
+        try:
+            tzinfo = ZoneInfo(parameters["TZID"])
+        except Exception:
+            raise ValueError("Unknown time zone %s" % parameters["TZID"])
+    else:
+        tzinfo = None
+
+    return datetime(int(value[0:4]), int(value[4:6]),   int(value[6:8]),
+                    int(value[9:11]), int(value[11:13]), int(value[13:15]), tzinfo=tzinfo)
+
+
+
+def DecodeText(value):
+    """
+    Removes the escaping of a ``TEXT`` value.
+    The order of the replacements is the same as the one of the *icalendar* module.
+    """
+    if "\\" not in value:
+        return value
+    return value.replace("\\N", "\\n") \
+                .replace("\\n", "\n")  \
+                .replace("\\,", ",")   \
+                .replace("\\;", ";")   \
+                .replace("\\\\", "\\")
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,136 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module provides a thread safe least recently used (LRU) cache with a size limit.
+
+The size of an entry is given by the user when the entry gets stored.
+It does not have to be the exact memory consumption of the stored object,
+but it must be a good estimation for the limit to be meaningful.
+
+    .. code-block:: python
+
+        cache = LRUCache(1024*1024)  # 1MiB
+
+        value = cache.Get(key)
+        if value is None:
+            value = ExpensiveCalculation()
+            cache.Put(key, value, len(rawdata))
+"""
+
+import threading
+from collections import OrderedDict
+
+class LRUCache(object):
+    """
+    Args:
+        maxsize (int): Maximum sum of all entry sizes. ``0`` disables the cache.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.size    = 0
+        self.entries = OrderedDict()    # key -> (value, size)
+        self.lock    = threading.Lock()
+        self.hits    = 0
+        self.misses  = 0
+
+
+
+    def Get(self, key):
+        """
+        Returns the value stored for *key* and marks the entry as most recently used.
+
+        Returns:
+            The cached value or ``None`` if there is no entry for *key*
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+
+
+    def Put(self, key, value, size):
+        """
+        Stores a value in the cache.
+        Least recently used entries get removed until the size of all entries is below the limit.
+        Values larger than the limit do not get stored.
+
+        Args:
+            key: A hashable key
+            value: The value to store
+            size (int): Size of the entry
+
+        Returns:
+            *Nothing*
+        """
+        if size > self.maxsize:
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+
+            self.entries[key] = (value, size)
+            self.size        += size
+
+            while self.size > self.maxsize:
+                _, (_, oldsize) = self.entries.popitem(last=False)
+                self.size -= oldsize
+        return
+
+
+
+    def Resize(self, key, size):
+        """
+        Updates the size of an entry whose value grew or shrank after it got stored.
+        The entry gets marked as most recently used.
+        Least recently used entries get removed until the size of all entries is below the limit.
+        If the entry itself is larger than the limit, it gets removed.
+        Nothing happens if there is no entry for *key* (any more).
+
+        Args:
+            key: The key of the entry
+            size (int): New size of the entry
+
+        Returns:
+            *Nothing*
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return
+
+            if size > self.maxsize:
+                del self.entries[key]
+                self.size -= entry[1]
+                return
+
+            self.entries[key] = (entry[0], size)
+            self.entries.move_to_end(key)
+            self.size        += size - entry[1]
+
+            while self.size > self.maxsize:
+                _, (_, oldsize) = self.entries.popitem(last=False)
+                self.size -= oldsize
+        return
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
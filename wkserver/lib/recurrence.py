@@ -0,0 +1,284 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module expands recurring events locally, so that the CalDAV server does not have to do this.
+
+A :class:`~RecurrenceSet` gets created from the iCalendar data of one calendar object resource.
+The resource contains the master ``VEVENT`` with the ``RRULE``, ``RDATE`` and ``EXDATE`` properties
+and optional ``VEVENT`` components with a ``RECURRENCE-ID`` that override single occurrences.
+
+The occurrences are calculated in the wall-clock time of the master event's time zone,
+as defined in RFC 5545.
+Already expanded ranges are cached.
+When the requested range moves, only occurrences starting in the new part of the range get calculated.
+
+    .. code-block:: python
+
+        recurrenceset = RecurrenceSet(data)
+        events = recurrenceset.Expand(start, end)
+
+The events are :class:`wkserver.lib.event.Event` objects like the ones returned by :meth:`wkserver.lib.icalparser.ParseEvents`.
+"""
+
+import re
+import logging
+import threading
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo
+from dateutil.rrule import rruleset, rrulestr
+from icalendar import Calendar
+from wkserver.lib.icalparser import MISSINGSUMMARY
+from wkserver.lib.event      import Event
+
+MARGIN = timedelta(days=1)  # Covers the difference between the server's and the event's time zone
+OCCURRENCESIZE = 200        # Estimated memory in bytes of an expanded occurrence (event, wall-clock time and list entry)
+
+
+
+class RecurrenceSet(object):
+    """
+    Args:
+        data (str): iCalendar data of a calendar object resource
+
+    Raises:
+        ValueError: If the recurrence rules are invalid
+    """
+    def __init__(self, data):
+        self.lock        = threading.Lock()
+        self.data        = data     # Kept to recreate the set from a snapshot
+        self.masters     = []       # One entry for each master VEVENT (usually just one)
+        self.overrides   = []       # Events of the VEVENTs with RECURRENCE-ID
+        self.covered     = None     # (start, end) range of occurrence start times that got expanded
+        self.occurrences = []       # (wall-clock start, event) of each occurrence in the covered range
+        self.cachekey    = None     # Key of the set in the event cache of the calendar client
+
+        ical       = Calendar.from_ical(data)
+        components = ical.walk("VEVENT")
+        overridden = {}             # UID -> [RECURRENCE-ID, ...]
+        for component in components:
+            if "RECURRENCE-ID" in component:
+                uid = str(component.get("UID"))
+                overridden.setdefault(uid, []).append(component.decoded("RECURRENCE-ID"))
+                self.overrides.append(self.MakeEvent(component, *self.GetTimes(component)))
+
+        for component in components:
+            if "RECURRENCE-ID" not in component:
+                uid = str(component.get("UID"))
+                self.masters.append(self.CreateMaster(component, overridden.get(uid, [])))
+
+
+
+    def Size(self):
+        """
+        Returns an estimation of the memory used by this set in bytes.
+        It includes the iCalendar data and all expanded occurrences, so it grows with the covered range.
+        """
+        with self.lock:
+            return len(self.data) + (len(self.occurrences) + len(self.overrides)) * OCCURRENCESIZE
+
+
+
+    def GetTimes(self, component):
+        """
+        Returns the start and the end of a VEVENT.
+        If there is no ``DTEND``, the ``DURATION`` or the defaults of RFC 5545 are used.
+        """
+        start = component.decoded("DTSTART")
+        if "DTEND" in component:
+            end = component.decoded("DTEND")
+        elif "DURATION" in component:
+            end = start + component.decoded("DURATION")
+        elif type(start) == date:
+            end = start + timedelta(days=1)
+        else:
+            end = start
+        return start, end
+
+
+
+    def MakeEvent(self, component, start, end):
+        try:
+            summary = component.decoded("SUMMARY").decode("utf-8")
+        except KeyError:
+            logging.error("Key Error: \"SUMMARY\" not found for event at %s!", str(start))
+            summary = MISSINGSUMMARY
+        return Event.FromValues(start, end, summary)
+
+
+
+    def CreateMaster(self, component, recurrenceids):
+        """
+        Creates the rule set of a master VEVENT.
+        Overridden occurrences (*recurrenceids*) get excluded from the set.
+        """
+        start, end = self.GetTimes(component)
+
+        master = {}
+        master["component"] = component
+        master["allday"]    = type(start) == date
+        master["duration"]  = end - start
+        master["timezone"]  = self.GetTimeZone(start)
+
+        walltime = self.WallTime(start, master["timezone"])
+        rules    = rruleset()
+        rules.rdate(walltime)   # DTSTART is always the first instance
+
+        for rrule in self.GetList(component, "RRULE"):
+            text = rrule.to_ical().decode("utf-8")
+            text = self.FixUntil(text, master["timezone"])
+            rules.rrule(rrulestr(text, dtstart=walltime, ignoretz=True))
+
+        for rdate in self.GetDates(component, "RDATE"):
+            rules.rdate(self.WallTime(rdate, master["timezone"]))
+        for exdate in self.GetDates(component, "EXDATE") + recurrenceids:
+            rules.exdate(self.WallTime(exdate, master["timezone"]))
+
+        master["rules"] = rules
+        return master
+
+
+
+    def GetList(self, component, name):
+        value = component.get(name)
+        if value is None:
+            return []
+        if type(value) != list:
+            return [value]
+        return value
+
+    def GetDates(self, component, name):
+        dates = []
+        for value in self.GetList(component, name):
+            dates += [entry.dt for entry in value.dts]
+        return dates
+
+
+
+    def GetTimeZone(self, start):
+        """
+        Returns the time zone of the master event's start.
+        pytz time zones get replaced by ``zoneinfo`` time zones when possible.
+        ``None`` is returned for all-day and floating events.
+        """
+        if type(start) == date or start.tzinfo is None:
+            return None
+        name = getattr(start.tzinfo, "zone", None)
+        if name:
+            try:
+                return ZoneInfo(name)
+            except Exception:
+                pass
+        return start.tzinfo
+
+
+
+    def WallTime(self, value, tz):
+        """
+        Converts a date or date-time into a naive date-time in the time zone *tz*.
+        """
+        if type(value) == date:
+            return datetime.combine(value, time())
+        if value.tzinfo is not None and tz is not None:
+            value = value.astimezone(tz)
+        return value.replace(tzinfo=None)
+
+
+
+    def Localize(self, walltime, tz):
+        if tz is None:
+            return walltime
+        if hasattr(tz, "localize"):
+            return tz.localize(walltime)    # pytz style time zone
+        return walltime.replace(tzinfo=tz)
+
+
+
+    def FixUntil(self, text, tz):
+        """
+        The rules get expanded in wall-clock time.
+        So an ``UNTIL`` value in UTC gets converted into the master event's time zone.
+        """
+        def ToWallTime(match):
+            until = datetime.strptime(match.group(1), "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+            if tz is not None:
+                until = until.astimezone(tz)
+            return "UNTIL=" + until.strftime("%Y%m%dT%H%M%S")
+        return re.sub(r"UNTIL=(\d{8}T\d{6})Z", ToWallTime, text)
+
+
+
+    def Calculate(self, start, end):
+        """
+        Returns all occurrences starting in the range [*start*, *end*) of wall-clock time.
+
+        Returns:
+            A list of tuples with the wall-clock start time and the event of an occurrence
+        """
+        occurrences = []
+        for master in self.masters:
+            for walltime in master["rules"].between(start, end, inc=True):
+                if walltime >= end:
+                    continue
+                if master["allday"]:
+                    occurrencestart = walltime.date()
+                else:
+                    occurrencestart = self.Localize(walltime, master["timezone"])
+                occurrenceend = occurrencestart + master["duration"]
+                occurrences.append((walltime, self.MakeEvent(master["component"], occurrencestart, occurrenceend)))
+        return occurrences
+
+
+
+    def Expand(self, start, end):
+        """
+        Returns all events that may overlap the range [*start*, *end*).
+        The events are not sorted and may contain some events close to the range.
+        The caller is responsible for the exact filtering.
+
+        Args:
+            start (datetime): Begin of the range (naive, local time)
+            end (datetime): End of the range (naive, local time)
+
+        Returns:
+            A list of :class:`~wkserver.lib.event.Event` objects. The list and its events must not be modified.
+        """
+        maxduration = max([master["duration"] for master in self.masters], default=timedelta(0))
+        rangestart  = start - maxduration - MARGIN
+        rangeend    = end + MARGIN
+
+        with self.lock:
+            if self.covered and rangestart <= self.covered[1] and self.covered[0] <= rangeend:
+                # Only calculate the occurrences of the new parts of the range
+                if rangestart < self.covered[0]:
+                    self.occurrences = self.Calculate(rangestart, self.covered[0]) + self.occurrences
+                    self.covered = (rangestart, self.covered[1])
+                if rangeend > self.covered[1]:
+                    self.occurrences = self.occurrences + self.Calculate(self.covered[1], rangeend)
+                    self.covered = (self.covered[0], rangeend)
+            else:
+                self.occurrences = self.Calculate(rangestart, rangeend)
+                self.covered     = (rangestart, rangeend)
+
+            # Drop occurrences that are far before the range (the window only moves forward)
+            if self.covered[0] < rangestart - timedelta(weeks=4):
+                self.occurrences = [occurrence for occurrence in self.occurrences if occurrence[0] >= rangestart]
+                self.covered     = (rangestart, self.covered[1])
+
+            return [occurrence[1] for occurrence in self.occurrences] + self.overrides
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
@@ -0,0 +1,110 @@
+# WKServer,  Web-Socket server for the WandKalendar project
+# Copyright (C) 2022  Ralf Stemmer <ralf.stemmer@gmx.net>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+This module reads and writes snapshot files.
+A snapshot contains the state of all calendars, so that the server can provide the events right after a restart.
+
+The snapshot is a JSON document.
+If the path of the file ends with ``.gz``, the file gets compressed with gzip.
+Writing is atomic: The data get written into a temporary file next to the snapshot file
+that replaces the old snapshot when it is complete.
+So a crash while writing never leaves a broken snapshot behind.
+
+    .. code-block:: python
+
+        WriteSnapshot("/var/lib/wkserver/snapshot.json.gz", state)
+        state = ReadSnapshot("/var/lib/wkserver/snapshot.json.gz")
+"""
+
+import os
+import gzip
+import json
+import logging
+
+SNAPSHOTVERSION = 1
+
+
+
+def WriteSnapshot(path, state):
+    """
+    Writes the *state* atomically into the snapshot file at *path*.
+
+    Args:
+        path (str): Path of the snapshot file
+        state (dict): JSON serializable state
+
+    Returns:
+        ``True`` on success, otherwise ``False``
+    """
+    snapshot = {}
+    snapshot["version"] = SNAPSHOTVERSION
+    snapshot["state"]   = state
+    rawdata  = json.dumps(snapshot, separators=(",", ":")).encode("utf-8")
+    if path.endswith(".gz"):
+        rawdata = gzip.compress(rawdata, compresslevel=6)
+
+    temppath = path + ".tmp"
+    try:
+        with open(temppath, "wb") as snapshotfile:
+            snapshotfile.write(rawdata)
+            snapshotfile.flush()
+            os.fsync(snapshotfile.fileno())
+        os.replace(temppath, path)
+    except Exception as e:
+        logging.warning("Writing snapshot %s failed with error %s! \033[1;30m(The old snapshot remains)", path, str(e))
+        try:
+            os.remove(temppath)
+        except OSError:
+            pass
+        return False
+
+    logging.debug("Snapshot with %i bytes written to %s", len(rawdata), path)
+    return True
+
+
+
+def ReadSnapshot(path):
+    """
+    Reads the state from the snapshot file at *path*.
+
+    Args:
+        path (str): Path of the snapshot file
+
+    Returns:
+        The state dictionary or ``None`` if there is no valid snapshot
+    """
+    if not os.path.isfile(path):
+        logging.debug("No snapshot at %s", path)
+        return None
+
+    try:
+        with open(path, "rb") as snapshotfile:
+            rawdata = snapshotfile.read()
+        if path.endswith(".gz"):
+            rawdata = gzip.decompress(rawdata)
+        snapshot = json.loads(rawdata.decode("utf-8"))
+    except Exception as e:
+        logging.warning("Reading snapshot %s failed with error %s! \033[1;30m(Snapshot will be ignored)", path, str(e))
+        return None
+
+    if type(snapshot) != dict or snapshot.get("version") != SNAPSHOTVERSION:
+        logging.warning("Snapshot %s has an unsupported format. \033[1;30m(Snapshot will be ignored)", path)
+        return None
+    return snapshot.get("state")
+
+
+# vim: tabstop=4 expandtab shiftwidth=4 softtabstop=4
+
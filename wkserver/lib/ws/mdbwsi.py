@@ -19,14 +19,137 @@ Overview of all WebAPI Methods sorted by category (some methods appear multiple
 Available Methods
 ^^^^^^^^^^^^^^^^^
 
+    * :meth:`~WKServerWebSocketInterface.GetEvents`
+    * :meth:`~WKServerWebSocketInterface.GetCalendar`
+
 """
 from wkserver.lib.cfg.wkserver   import WKServerConfig
 from wkserver.classes.calendarclient import CalendarClientManager
-from threading          import Thread
-import os
+from wkserver.lib.ws.websocket  import EncodePacket
+from wkserver.lib.event         import DateToTimestamp
+from datetime           import datetime, date
+import asyncio
 import logging
-import random
-import traceback
+
+PreparedUpdates = {}    # (fncname, calendar name, binary) -> (data, prepared notification)
+KeepAlivePacket = {
+        "method":   "notification",
+        "fncname":  "WKServer:KeepAlive",
+        "fncsig":   "onKeepAlive",
+        "arguments":None,
+        "pass":     None}
+
+def PrepareCalendarUpdate(factory, fncname, data, binary=False):
+    """
+    Returns the prepared calendar notification for the calendar data or delta.
+    The notification gets encoded and framed only once for the latest data of each calendar and each encoding,
+    and the same WebSocket frame gets sent to all connections.
+
+    For clients with binary encoding the data get compacted (See :meth:`~CompactCalendarData` and :meth:`~CompactCalendarDelta`).
+
+    Args:
+        factory: The :class:`~lib.ws.websocket.WKServerWebSocketFactory` of the connections
+        fncname (str): ``"WKServer:CalendarUpdate"`` for complete calendar data or ``"WKServer:CalendarDelta"`` for a delta
+        data (dict): Calendar data or delta as passed to the calendar callbacks. It must not be modified.
+        binary (bool): ``True`` to prepare the notification for clients with binary encoding
+
+    Returns:
+        The prepared notification (See :meth:`~lib.ws.websocket.WKServerWebSocketFactory.PreparePacket`)
+    """
+    key    = (fncname, data["name"], binary)
+    cached = PreparedUpdates.get(key)
+    if cached is not None and cached[0] is data:
+        return cached[1]
+
+    if binary and fncname == "WKServer:CalendarDelta":
+        arguments = CompactCalendarDelta(data)
+    elif binary:
+        arguments = CompactCalendarData(data)
+    else:
+        arguments = data
+
+    packet = {}
+    packet["method"]      = "notification"
+    packet["fncname"]     = fncname
+    packet["fncsig"]      = "onCalendarUpdate"
+    packet["arguments"]   = arguments
+    packet["pass"]        = None
+    preparedmessage = factory.PreparePacket(EncodePacket(packet, binary), binary)
+    PreparedUpdates[key] = (data, preparedmessage)
+    return preparedmessage
+
+
+
+def CompactTimestamp(value, allday=False):
+    """
+    Converts a date or date-time string of the calendar data into an integer timestamp in seconds.
+    Dates are represented by 00:00 UTC of that day (See :meth:`wkserver.lib.event.DateToTimestamp`).
+    Date-times without time zone are local time.
+    """
+    if value is None:
+        return None
+    if allday:
+        return DateToTimestamp(date.fromisoformat(value))
+    return int(datetime.fromisoformat(value).timestamp())
+
+def CompactEvent(event):
+    """
+    Returns the compact representation of an event: ``[start, end, allday, summary, id]``
+    """
+    allday = event["allday"]
+    return [CompactTimestamp(event["start"], allday), CompactTimestamp(event["end"], allday), allday, event["summary"], event["id"]]
+
+def CompactRange(calendarrange):
+    return [CompactTimestamp(calendarrange["start"]), CompactTimestamp(calendarrange["end"])]
+
+
+
+def CompactCalendarData(calendardata):
+    """
+    Returns the compact representation of calendar data as it gets sent to clients with binary encoding.
+    The keys get shortened and all dates and times get replaced by integer timestamps in seconds.
+    ``ExpandCalendarData`` in ``WandKalender2/js/WebSockets.js`` reverses this.
+
+        ============= ==================================================
+        Calendar data Compact
+        ============= ==================================================
+        name          n
+        version       v
+        events        ev (list of compact events, see :meth:`~CompactEvent`)
+        isholiday     h
+        range         r (``[start, end]``)
+        stale         x
+        updated       u
+        ============= ==================================================
+    """
+    compact = {}
+    compact["n"]  = calendardata["name"]
+    compact["v"]  = calendardata.get("version")
+    compact["ev"] = [CompactEvent(event) for event in calendardata["events"]]
+    compact["h"]  = calendardata["isholiday"]
+    compact["r"]  = CompactRange(calendardata["range"])
+    compact["x"]  = calendardata["stale"]
+    compact["u"]  = CompactTimestamp(calendardata["updated"])
+    return compact
+
+def CompactCalendarDelta(delta):
+    """
+    Like :meth:`~CompactCalendarData` for a delta.
+    The base version is ``b``, the added events are ``ad`` and the IDs of the removed events are ``rm``.
+    """
+    compact = {}
+    compact["n"]  = delta["name"]
+    compact["v"]  = delta["version"]
+    compact["b"]  = delta["base"]
+    compact["ad"] = [CompactEvent(event) for event in delta["added"]]
+    compact["rm"] = delta["removed"]
+    compact["h"]  = delta["isholiday"]
+    compact["r"]  = CompactRange(delta["range"])
+    compact["x"]  = delta["stale"]
+    compact["u"]  = CompactTimestamp(delta["updated"])
+    return compact
+
+
 
 class WKServerWebSocketInterface(object):
     def __init__(self):
@@ -38,30 +161,79 @@ class WKServerWebSocketInterface(object):
             logging.exception(e)
             raise e
         self.cfg = WKServerConfig("/etc/wkserver.ini")
+        self.keepalivetimer = None
 
 
 
     def onWSConnect(self):
         self.calendarmanager.RegisterCallback(self.onCalendarUpdate)
+
+        # Provide the new client with the latest data right now instead of waiting for the next update
+        for calendardata in self.calendarmanager.GetLatestData():
+            self.onCalendarUpdate(calendardata)
+        self.ResetKeepAlive()
         return None
 
         
 
     def onWSDisconnect(self, wasClean, code, reason):
         self.calendarmanager.RemoveCallback(self.onCalendarUpdate)
+        if self.keepalivetimer:
+            self.keepalivetimer.cancel()
+            self.keepalivetimer = None
         return None
 
 
 
-    def onCalendarUpdate(self, calendardata):
-        response = {}
-        response["method"]      = "notification"
-        response["fncname"]     = "WKServer:CalendarUpdate"
-        response["fncsig"]      = "onCalendarUpdate"
-        response["arguments"]   = calendardata
-        response["pass"]        = None
-        success = self.SendPacket(response)
-        return success
+    def onCalendarUpdate(self, calendardata, delta=None):
+        """
+        Sends the changes of a calendar to the client.
+        If there is a *delta*, only the delta gets sent as ``WKServer:CalendarDelta`` notification.
+        Otherwise the complete calendar data get sent as ``WKServer:CalendarUpdate`` notification.
+        A client that does not have the version the delta is based on requests the complete data via :meth:`GetCalendar`.
+
+        The notification gets queued per calendar (See :meth:`~lib.ws.websocket.WebSocket.QueuePreparedPacket`),
+        so a slow client only gets the latest data of each calendar.
+        """
+        # A delta is useless when the client did not get the previous notification yet
+        key = calendardata["name"]
+        if delta is not None and not self.IsQueued(key):
+            preparedmessage = PrepareCalendarUpdate(self.factory, "WKServer:CalendarDelta", delta, self.binary)
+        else:
+            preparedmessage = PrepareCalendarUpdate(self.factory, "WKServer:CalendarUpdate", calendardata, self.binary)
+        self.QueuePreparedPacket(key, preparedmessage)
+        self.ResetKeepAlive()
+        self.factory.LogStatisticsPeriodically()
+        return None
+
+
+
+    def ResetKeepAlive(self):
+        """
+        Calendar updates are only sent when the data of a calendar changed.
+        So that the watchdog of the client does not bark while nothing changes,
+        a small ``WKServer:KeepAlive`` notification gets sent after ``[websocket]->keepalive`` seconds without any other notification.
+        This method restarts that period.
+        """
+        if self.keepalivetimer:
+            self.keepalivetimer.cancel()
+            self.keepalivetimer = None
+        if self.cfg.websocket.keepalive > 0:
+            eventloop = asyncio.get_event_loop()
+            self.keepalivetimer = eventloop.call_later(self.cfg.websocket.keepalive, self.onKeepAlive)
+        return
+
+
+
+    def onKeepAlive(self):
+        self.keepalivetimer = None
+        if not self.IsOpen():
+            return
+        rawdata = EncodePacket(KeepAlivePacket, self.binary)
+        self.QueuePreparedPacket("WKServer:KeepAlive", self.factory.PreparePacket(rawdata, self.binary))
+        self.ResetKeepAlive()
+        self.factory.LogStatisticsPeriodically()
+        return
 
 
 
@@ -99,12 +271,86 @@ class WKServerWebSocketInterface(object):
 
 
 
+    def GetEvents(self, start, end, calendars=None):
+        """
+        Returns the cached events of the calendars that overlap with the range from *start* to *end*.
+        The CalDAV server does not get accessed.
+        Only events inside the range of the last update are available (See ``[data]->past`` and ``[data]->future``).
+
+        Args:
+            start (str): Begin of the range as ISO 8601 date or date-time (like ``"2022-03-01"``)
+            end (str): End of the range as ISO 8601 date or date-time
+            calendars (list): Optional list of calendar names. If not given, all calendars are returned.
+
+        Returns:
+            A list of calendar data in the format of the ``WKServer:CalendarUpdate`` notification.
+            The ``range`` of each calendar data is the part of the requested range that is available.
+            Clients with binary encoding get the compact representation of each calendar data (See :meth:`~CompactCalendarData`).
+
+        Example:
+
+            .. code-block:: javascript
+
+                WKServer_Request("GetEvents", "ShowEvents", {start: "2022-03-01", end: "2022-04-01"});
+        """
+        try:
+            start = self.ParseDateTime(start)
+            end   = self.ParseDateTime(end)
+        except Exception as e:
+            logging.warning("Invalid range for GetEvents: %s! \033[0;33m(Empty list will be returned)", str(e))
+            return []
+
+        return self.calendarmanager.GetEvents(start, end, calendars)
+
+
+
+    def GetCalendar(self, name):
+        """
+        Returns the latest data of a calendar in the format of the ``WKServer:CalendarUpdate`` notification.
+        Clients use this method to resynchronize a calendar when they missed a ``WKServer:CalendarDelta`` notification.
+
+        Args:
+            name (str): Name of the calendar
+
+        Returns:
+            The calendar data or ``None`` if there are no data for this calendar.
+            Clients with binary encoding get the compact representation (See :meth:`~CompactCalendarData`).
+
+        Example:
+
+            .. code-block:: javascript
+
+                WKServer_Request("GetCalendar", "onCalendarUpdate", {name: "Holidays"});
+        """
+        return self.calendarmanager.GetCalendarData(name)
+
+
+
+    def ParseDateTime(self, value):
+        """
+        Converts an ISO 8601 string into a naive date-time in the local time zone.
+        """
+        value = datetime.fromisoformat(value)
+        if value.tzinfo is not None:
+            value = value.astimezone().replace(tzinfo=None)
+        return value
+
+
+
     def HandleCall(self, fncname, method, fncsig, args, passthrough):
         retval = None
 
         # Request-Methods
         if fncname == "HelloServer":
             retval = "Hello Client"
+        elif fncname == "GetEvents":
+            retval = self.GetEvents(args["start"], args["end"], args.get("calendars"))
+            if self.binary:
+                retval = [CompactCalendarData(calendardata) for calendardata in retval]
+        elif fncname == "GetCalendar":
+            retval = self.GetCalendar(args["name"])
+            if self.binary and retval is not None:
+                retval = CompactCalendarData(retval)
         else:
             logging.warning("Unknown function: %s! \033[0;33m(will be ignored)", str(fncname))
             return None
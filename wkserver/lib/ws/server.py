@@ -154,10 +154,11 @@ class WKServerWebSocketServer(object):
         return True
 
 
-    def HandleEvents(self):
+    def Run(self):
         """
-        This method handles the events inside the *Autobahn* internal event loop.
-        It should be called in a loop as long as the server shall work.
+        This method runs the event loop until :meth:`~StopRunning` gets called.
+        All connections, the calendar fetcher and the notifications are handled inside this event loop.
+        The method blocks until the event loop got stopped.
 
         Returns:
             *Nothing*
@@ -166,16 +167,21 @@ class WKServerWebSocketServer(object):
 
             .. code-block:: python
 
-                    while True:
-                        server.HandleEvents()
-                        
-                        if shutdown:
-                            server.Stop()
-                            break
+                    eventloop.add_signal_handler(signal.SIGTERM, server.StopRunning)
+                    server.Run()    # Returns after SIGTERM
+                    server.Stop()
+        """
+        self.eventloop.run_forever()
+
+
+    def StopRunning(self):
+        """
+        This method lets :meth:`~Run` return after the current iteration of the event loop.
 
-                        time.sleep(.1)  # Avoid high CPU load
+        Returns:
+            *Nothing*
         """
-        self.eventloop.run_until_complete(self.task)
+        self.eventloop.stop()
 
 
     def Stop(self):
@@ -25,12 +25,38 @@ Most interesting are the following methods:
 
 import json
 import time
-import traceback
+import collections
 import logging
 
 import txaio
 txaio.use_asyncio() # or .use_asyncio()
 from autobahn.asyncio.websocket import WebSocketServerProtocol, WebSocketServerFactory
+from autobahn.websocket.compress import PerMessageDeflateOffer, PerMessageDeflateOfferAccept
+from wkserver.lib.cbor import EncodeCBOR
+
+MAXQUEUESIZE = 32   # Maximum number of packets waiting for a slow client
+STATISTICSINTERVAL = 3600   # Minimum number of seconds between two logged traffic statistics
+SUBPROTOCOL_JSON = "wkserver.json"  # Packets get sent as JSON text messages
+SUBPROTOCOL_CBOR = "wkserver.cbor"  # Packets get sent as CBOR binary messages
+
+def EncodePacket(packet, binary=False):
+    """
+    Encodes a packet dictionary as it gets sent to the clients:
+    A UTF-8 encoded JSON string, or CBOR data (See :mod:`wkserver.lib.cbor`) when *binary* is ``True``.
+
+    Args:
+        packet: A packet dictionary
+        binary (bool): Encode the packet for a client that negotiated the binary encoding
+
+    Returns:
+        The encoded packet as ``bytes``
+    """
+    if binary:
+        return EncodeCBOR(packet)
+    rawdata = json.dumps(packet)
+    return rawdata.encode("utf-8")
+
+
 
 class WKServerWebSocketFactory(WebSocketServerFactory):
     """
@@ -46,6 +72,106 @@ class WKServerWebSocketFactory(WebSocketServerFactory):
 
         self.clients    = []    # for broadcast
 
+        self.allowbinary          = False   # Allow clients to negotiate the binary encoding
+        self.compressionthreshold = 0   # Smaller packets do not get compressed
+        self.compressedoctets     = 0   # Statistics of closed connections
+        self.uncompressedoctets   = 0
+        self.compressiontime      = 0.0
+        self.statisticstime       = time.monotonic()    # When the statistics got logged the last time
+
+
+
+    def SetupCompression(self, contexttakeover=True, windowbits=15, threshold=0):
+        """
+        Enables the ``permessage-deflate`` WebSocket extension.
+        Clients offering this extension get their notifications compressed.
+
+        With context takeover the compressor keeps its dictionary between messages,
+        so the repetitive JSON of the calendar notifications compresses better.
+        Without it, each message gets compressed on its own which saves memory on both sides.
+        Packets smaller than *threshold* bytes get sent uncompressed.
+
+        Compression happens for each connection, so with compression enabled a prepared packet
+        (See :meth:`~PreparePacket`) only saves the encoding, not the framing.
+
+        Args:
+            contexttakeover (bool): Allow the server to keep the compression context between messages
+            windowbits (int): Maximum size of the compression window as power of two (9 to 15)
+            threshold (int): Minimum size of a packet in bytes to get compressed
+
+        Returns:
+            *Nothing*
+        """
+        def AcceptOffer(offers):
+            for offer in offers:
+                if not isinstance(offer, PerMessageDeflateOffer):
+                    continue
+
+                bits = windowbits
+                if offer.request_max_window_bits != 0:
+                    bits = min(bits, offer.request_max_window_bits)
+                return PerMessageDeflateOfferAccept(offer,
+                        no_context_takeover = (not contexttakeover) or offer.request_no_context_takeover,
+                        window_bits         = bits)
+            return None
+
+        self.setProtocolOptions(perMessageCompressionAccept=AcceptOffer)
+        self.compressionthreshold = threshold
+        logging.debug("permessage-deflate enabled \033[1;30m(context takeover: %s, window bits: %i, threshold: %i bytes)",
+                str(contexttakeover), windowbits, threshold)
+        return
+
+
+
+    def AddStatistics(self, compressedoctets, uncompressedoctets, compressiontime):
+        """
+        Adds the compression statistics of a closed connection to the statistics of the factory.
+        """
+        self.compressedoctets   += compressedoctets
+        self.uncompressedoctets += uncompressedoctets
+        self.compressiontime    += compressiontime
+        return
+
+
+
+    def LogStatistics(self):
+        """
+        Logs the compression ratio of all connections and the CPU time spent on compressing.
+        The statistics get logged periodically (See :meth:`~LogStatisticsPeriodically`) and when the server shuts down.
+        The statistics of each single connection get logged as debug message when it gets closed.
+        """
+        self.statisticstime = time.monotonic()
+        compressedoctets   = self.compressedoctets
+        uncompressedoctets = self.uncompressedoctets
+        compressiontime    = self.compressiontime
+        for client in self.clients:
+            statistics = client.CompressionStatistics()
+            compressedoctets   += statistics[0]
+            uncompressedoctets += statistics[1]
+            compressiontime    += statistics[2]
+
+        if uncompressedoctets == 0:
+            return
+        logging.info("WebSocket traffic: %i KiB sent as %i KiB \033[1;30m(%.1f%%, %.1f ms CPU time for compressing)",
+                uncompressedoctets // 1024, compressedoctets // 1024,
+                100.0 * compressedoctets / uncompressedoctets, compressiontime * 1000)
+        return
+
+
+
+    def LogStatisticsPeriodically(self):
+        """
+        Logs the statistics (See :meth:`~LogStatistics`) if they were not logged for ``STATISTICSINTERVAL`` seconds.
+        This method is cheap enough to be called for each notification of each connection.
+
+        Returns:
+            *Nothing*
+        """
+        if time.monotonic() - self.statisticstime < STATISTICSINTERVAL:
+            return
+        self.LogStatistics()
+        return
+
 
 
     def AddToBroadcast(self, client):
@@ -92,13 +218,34 @@ class WKServerWebSocketFactory(WebSocketServerFactory):
         packet["method"] = "broadcast"
         logging.debug("Sending Broadcast Message. \033[1;30m(fncname = %s, fncsig = %s)", packet["fncname"], packet["fncsig"])
 
+        preparedmessages = {}   # One prepared message for each encoding
         for client in self.clients:
             try:
-                client.SendPacket(packet)
+                if client.binary not in preparedmessages:
+                    preparedmessages[client.binary] = self.PreparePacket(EncodePacket(packet, client.binary), client.binary)
+                client.SendPreparedPacket(preparedmessages[client.binary])
             except Exception as e:
                 logging.warning("Sending broadcast packet failed for one client with error: %s\033[1;30m (Ignoring that client)", str(e))
 
 
+    def PreparePacket(self, rawdata, binary=False):
+        """
+        Creates the WebSocket frame of an encoded packet (See :meth:`~lib.ws.websocket.EncodePacket`).
+        The prepared message can be sent to any number of clients with the same encoding using :meth:`~lib.ws.websocket.WebSocket.SendPreparedPacket`.
+
+        Args:
+            rawdata (bytes): The encoded packet
+            binary (bool): ``True`` if the packet is CBOR encoded, ``False`` for JSON
+
+        Returns:
+            A prepared message of the *Autobahn* framework
+        """
+        donotcompress   = len(rawdata) < self.compressionthreshold
+        preparedmessage = self.prepareMessage(rawdata, isBinary=binary, doNotCompress=donotcompress)
+        preparedmessage.size = len(rawdata)    # Autobahn only keeps the payload of compressible messages
+        return preparedmessage
+
+
     def CloseConnections(self):
         """
         This method initiates a closing handshake to all connections with error code ``1000`` and reason ``"Server shutdown"``
@@ -106,6 +253,7 @@ class WKServerWebSocketFactory(WebSocketServerFactory):
         Returns:
             *Nothing*
         """
+        self.LogStatistics()
         for client in self.clients:
             try:
                 client.sendClose(1000, "Server shutdown")
@@ -123,6 +271,12 @@ class WebSocket(WebSocketServerProtocol):
     def __init__(self):
         WebSocketServerProtocol.__init__(self)
         self.connected = False
+        self.binary    = False  # True when the client negotiated the binary encoding (CBOR)
+        self.outbox    = collections.OrderedDict()  # key -> prepared message waiting to be sent
+        self.paused    = False  # True while the write buffer of the transport is full
+        self.compressiontime = 0.0  # CPU time in seconds spent on sending compressed messages
+        self.compressedoctets   = 0 # Payload of the sent messages after compression
+        self.uncompressedoctets = 0 # Payload of the sent messages before compression
 
 
 
@@ -248,9 +402,194 @@ class WebSocket(WebSocketServerProtocol):
 
         #packet  = self.BeautifyValues(packet, "name", "∕",   "/");
         #packet  = self.BeautifyValues(packet, "name", " - ", " – ");
-        rawdata = json.dumps(packet)
-        rawdata = rawdata.encode("utf-8")
-        
+        rawdata = EncodePacket(packet, self.binary)
+        return self.SendRawPacket(rawdata)
+
+
+
+    def SendRawPacket(self, rawdata):
+        """
+        This method sends a packet that was already encoded by :meth:`~lib.ws.websocket.EncodePacket`.
+        So the same encoded packet can be sent to multiple clients without encoding it again.
+        The packet must be encoded for the encoding negotiated by this client (See ``self.binary``).
+
+        Args:
+            rawdata (bytes): The encoded packet
+
+        Returns:
+            ``True`` on success, otherwise ``False``
+
+        Raises:
+            RuntimeError: If *Autobahns* ``WebSocketServerProtocol`` class did not set an internal state.
+        """
+        if not self.IsOpen():
+            return False
+
+        donotcompress = len(rawdata) < self.factory.compressionthreshold
+        compressed    = self._perMessageCompress is not None and not donotcompress
+        try:
+            octets    = self.trafficStats.outgoingOctetsWebSocketLevel
+            starttime = time.thread_time()
+            self.sendMessage(rawdata, self.binary, doNotCompress=donotcompress)
+            self.CountMessage(len(rawdata), compressed, octets, time.thread_time() - starttime)
+        except Exception as e:
+            logging.warning("Unexpected error while trying to send a message: %s! \033[0;33m(message will be discard)", str(e))
+            return False
+        return True
+
+
+
+    def SendPreparedPacket(self, preparedmessage):
+        """
+        This method sends a packet that was already encoded and framed by :meth:`~lib.ws.websocket.WKServerWebSocketFactory.PreparePacket`.
+        The same WebSocket frame gets written to each client, so neither the encoding nor the framing gets repeated for each client.
+        The packet must be encoded for the encoding negotiated by this client (See ``self.binary``).
+
+        Args:
+            preparedmessage: A prepared message of the *Autobahn* framework
+
+        Returns:
+            ``True`` on success, otherwise ``False``
+
+        Raises:
+            RuntimeError: If *Autobahns* ``WebSocketServerProtocol`` class did not set an internal state.
+        """
+        if not self.IsOpen():
+            return False
+
+        compressed = self._perMessageCompress is not None and not preparedmessage.doNotCompress
+        try:
+            octets    = self.trafficStats.outgoingOctetsWebSocketLevel
+            starttime = time.thread_time()
+            self.sendPreparedMessage(preparedmessage)
+            self.CountMessage(preparedmessage.size, compressed, octets, time.thread_time() - starttime)
+        except Exception as e:
+            logging.warning("Unexpected error while trying to send a message: %s! \033[0;33m(message will be discard)", str(e))
+            return False
+        return True
+
+
+
+    def CountMessage(self, size, compressed, octets, cputime):
+        """
+        Adds a sent message to the compression statistics of this connection.
+
+        Uncompressed prepared messages get written directly to the transport,
+        so the traffic statistics of *Autobahn* do not include them.
+        Therefore the sizes get counted here.
+        Only for compressed messages the compressed size gets taken from the traffic statistics.
+
+        Args:
+            size (int): Size of the payload in bytes
+            compressed (bool): ``True`` if the message got compressed
+            octets (int): Value of ``trafficStats.outgoingOctetsWebSocketLevel`` before sending the message
+            cputime (float): CPU time of the event loop thread in seconds spent on sending the message
+
+        Returns:
+            *Nothing*
+        """
+        self.uncompressedoctets += size
+        if compressed:
+            self.compressedoctets += self.trafficStats.outgoingOctetsWebSocketLevel - octets
+            self.compressiontime  += cputime
+        else:
+            self.compressedoctets += size
+        return
+
+
+
+    def QueuePreparedPacket(self, key, preparedmessage):
+        """
+        Queues a prepared packet (See :meth:`~lib.ws.websocket.WKServerWebSocketFactory.PreparePacket`) for this client.
+        The packet gets sent immediately unless the client does not keep up with reading the data.
+        Then the packets wait in a bounded queue until the write buffer of the connection got drained.
+
+        A queued packet with the same *key* gets replaced by the new one (latest wins).
+        When the queue holds more than ``MAXQUEUESIZE`` packets, the oldest one gets dropped.
+        So a slow client never lets the memory grow without limit or blocks the sender.
+
+        This method must be called inside the thread of the event loop.
+        Other threads must hand the packet over via ``eventloop.call_soon_threadsafe``.
+
+        Args:
+            key: A hashable value identifying the content of the packet, like the name of a calendar
+            preparedmessage: A prepared message of the *Autobahn* framework
+
+        Returns:
+            *Nothing*
+        """
+        self.outbox.pop(key, None)
+        self.outbox[key] = preparedmessage
+        if len(self.outbox) > MAXQUEUESIZE:
+            droppedkey, _ = self.outbox.popitem(last=False)
+            logging.warning("Outbound queue of %s is full! \033[1;30m(Dropping packet %s)", str(self.peer), str(droppedkey))
+        self.FlushQueue()
+        return
+
+
+
+    def IsQueued(self, key):
+        """
+        Returns ``True`` if a packet with the *key* is still waiting in the queue of this client.
+        """
+        return key in self.outbox
+
+
+
+    def FlushQueue(self):
+        """
+        Sends the queued packets until the queue is empty or the write buffer of the connection is full.
+        """
+        while self.outbox and not self.paused:
+            key, preparedmessage = self.outbox.popitem(last=False)
+            self.SendPreparedPacket(preparedmessage)
+        return
+
+
+
+    def pause_writing(self):
+        """
+        Called by the asyncio transport when its write buffer exceeds the high-water mark.
+        Packets get queued until :meth:`resume_writing` gets called.
+        """
+        self.paused = True
+
+    def resume_writing(self):
+        """
+        Called by the asyncio transport when its write buffer got drained below the low-water mark.
+        """
+        self.paused = False
+        self.FlushQueue()
+
+
+
+    def CompressionStatistics(self):
+        """
+        Returns the number of bytes of the messages sent on this connection after and before compression
+        and the CPU time of the event loop thread spent on sending the compressed messages.
+        Without compression both sizes are equal.
+
+        Returns:
+            A tuple ``(compressed octets, uncompressed octets, CPU time in seconds)``
+        """
+        return (self.compressedoctets, self.uncompressedoctets, self.compressiontime)
+
+
+
+    def IsOpen(self):
+        """
+        Checks if the connection is established and its state is *OPEN*, so that messages can be sent.
+
+        Returns:
+            ``True`` if messages can be sent, otherwise ``False``
+
+        Raises:
+            RuntimeError: If *Autobahns* ``WebSocketServerProtocol`` class did not set an internal state.
+        """
+        if self.connected == False:
+            logging.warning("Socket not conneced! \033[1;30m(message will be discard) %s", str(self))
+            return False
+
         if not hasattr(self, "state"):
             # This can hatten in some strange situation where Autobahn seems to be in a half-connected state.
             # Usually this should never happen, but happend at least once.
@@ -266,12 +605,6 @@ class WebSocket(WebSocketServerProtocol):
             # STATE_CLOSING = 2
             # STATE_OPEN = 3
             return False
-
-        try:
-            self.sendMessage(rawdata, False)
-        except Exception as e:
-            logging.warning("Unexpected error while trying to send a message: %s! \033[0;33m(message will be discard)", str(e))
-            return False
         return True
 
 
@@ -293,15 +626,27 @@ class WebSocket(WebSocketServerProtocol):
 
     def onConnect(self, request):
         """
-        Just prints the IP address of the connecting client.
-        See  for details.
-        `ConnectionRequest in the Autobahn documentation <https://autobahn.readthedocs.io/en/latest/reference/autobahn.websocket.html?highlight=ConnectionRequest#autobahn.websocket.types.ConnectionRequest>`_ for details.
+        Prints the IP address of the connecting client and negotiates the encoding of the packets.
+        See `ConnectionRequest in the Autobahn documentation <https://autobahn.readthedocs.io/en/latest/reference/autobahn.websocket.html?highlight=ConnectionRequest#autobahn.websocket.types.ConnectionRequest>`_ for details.
+
+        The encoding gets selected via the WebSocket subprotocol:
+
+            * ``wkserver.cbor``: Packets get sent as CBOR encoded binary messages (if the factory allows it)
+            * ``wkserver.json``: Packets get sent as JSON encoded text messages
+            * No subprotocol: Like ``wkserver.json``
+
+        Packets from the client are always JSON encoded text messages.
 
         Returns:
-            *Nothing*
+            The selected subprotocol or ``None``
         """
         logging.debug("Client connecting fron: %s"%(str(request.peer)))
-        return
+        if self.factory.allowbinary and SUBPROTOCOL_CBOR in request.protocols:
+            self.binary = True
+            return SUBPROTOCOL_CBOR
+        if SUBPROTOCOL_JSON in request.protocols:
+            return SUBPROTOCOL_JSON
+        return None
 
 
     def onOpen(self):
@@ -329,6 +674,13 @@ class WebSocket(WebSocketServerProtocol):
         if self.connected:
             self.connected = False
             self.factory.RemoveFromBroadcast(self)
+            self.outbox.clear()
+            compressedoctets, uncompressedoctets, compressiontime = self.CompressionStatistics()
+            self.factory.AddStatistics(compressedoctets, uncompressedoctets, compressiontime)
+            if uncompressedoctets > 0:
+                logging.debug("Sent %i bytes as %i bytes \033[1;30m(%.1f%%, %.1f ms CPU time for compressing)",
+                        uncompressedoctets, compressedoctets,
+                        100.0 * compressedoctets / uncompressedoctets, compressiontime * 1000)
             self.onWSDisconnect(wasClean, code, reason)
 
         if code == WebSocketServerProtocol.CLOSE_STATUS_CODE_NORMAL:
@@ -381,7 +733,7 @@ class WebSocket(WebSocketServerProtocol):
             ``None``
         """
 
-        # I do not expect binary data
+        # I do not expect binary data (even clients with binary encoding send JSON)
         if isBinary == True:
             logging.warning("Got a binary encoded message. \033[0;33m(Message will be ignored)")
             return None